@@ -0,0 +1,81 @@
+"""Micro-benchmark of comment merging
+
+Merges long, repetitive comments from many sources, the way a popular
+domain's comments get merged across lots of blocklists. Compares the
+original pairwise, list-based merge with the single-pass CommentMerger.
+
+Usage: python benchmarks/bench_merge_comments.py [sources] [tokens]
+"""
+
+import sys
+import timeit
+
+from fediblockhole import CommentMerger
+
+
+def legacy_merge_comments(oldcomment: str, newcomment: str) -> str:
+    """The original list-based merge_comments, for comparison"""
+    if oldcomment in ["", None] and newcomment in ["", None]:
+        return ""
+    if oldcomment == newcomment or newcomment in ["", None]:
+        return oldcomment
+    if oldcomment in ["", None]:
+        return newcomment
+
+    old_tokens = oldcomment.split(", ")
+    new_tokens = newcomment.split(", ")
+    while "" in old_tokens:
+        old_tokens.remove("")
+    while "" in new_tokens:
+        new_tokens.remove("")
+    for token in old_tokens:
+        if token in new_tokens:
+            new_tokens.remove(token)
+    tokenset = old_tokens
+    tokenset.extend(new_tokens)
+    return ", ".join(tokenset)
+
+
+def make_comments(sources: int, tokens: int) -> list:
+    """Build overlapping comments, each sharing most tokens with the others"""
+    vocabulary = [f"reason {i}" for i in range(tokens * 2)]
+    comments = []
+    for source in range(sources):
+        start = (source * 7) % tokens
+        end = start + tokens
+        comments.append(", ".join(vocabulary[start:end]))
+    return comments
+
+
+def pairwise(comments: list) -> str:
+    merged = comments[0]
+    for comment in comments[1:]:
+        merged = legacy_merge_comments(merged, comment)
+    return merged
+
+
+def single_pass(comments: list) -> str:
+    merger = CommentMerger()
+    for comment in comments:
+        merger.add(comment)
+    return merger.merged()
+
+
+def main():
+    sources = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    comments = make_comments(sources, tokens)
+
+    assert pairwise(comments) == single_pass(comments)
+
+    for name, func in [("pairwise", pairwise), ("single pass", single_pass)]:
+        number = 10
+        elapsed = min(timeit.repeat(lambda: func(comments), number=number, repeat=3))
+        print(
+            f"{name:>12}: {elapsed / number * 1000:.3f} ms per domain "
+            f"({sources} sources, {tokens} tokens each)"
+        )
+
+
+if __name__ == "__main__":
+    main()
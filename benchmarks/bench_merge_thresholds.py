@@ -0,0 +1,71 @@
+"""Benchmark of threshold-based merging at scale
+
+Builds synthetic blocklists covering a large number of domains, then times
+the bulk threshold check on its own, with and without NumPy, and a full
+merge_blocklists() run with a threshold.
+
+Usage: python benchmarks/bench_merge_thresholds.py [domains] [sources]
+"""
+
+import random
+import sys
+import time
+from array import array
+
+import fediblockhole
+from fediblockhole import merge_blocklists, threshold_mask
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.const import DomainBlock
+
+
+def make_blocklists(domains: int, sources: int) -> list:
+    """Each domain appears in a random number of the sources"""
+    rng = random.Random(42)
+    blocklists = [Blocklist(f"source{i}") for i in range(sources)]
+    for n in range(domains):
+        domain = f"domain{n}.example"
+        for bl in rng.sample(blocklists, rng.randint(1, sources)):
+            bl.blocks[domain] = DomainBlock(domain, "suspend")
+    return blocklists
+
+
+def timed(label: str, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{label:>32}: {time.perf_counter() - start:.3f} s")
+    return result
+
+
+def main():
+    domains = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sources = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"Building {sources} blocklists covering {domains} domains...")
+    blocklists = make_blocklists(domains, sources)
+
+    rng = random.Random(7)
+    counts = array("L", (rng.randint(1, sources) for _ in range(domains)))
+
+    numpy = fediblockhole.np
+    if numpy is not None:
+        timed("threshold_mask pct (numpy)", threshold_mask, counts, sources, 50, "pct")
+    else:
+        print("NumPy is not installed. Skipping the NumPy timings.")
+
+    fediblockhole.np = None
+    timed("threshold_mask pct (python)", threshold_mask, counts, sources, 50, "pct")
+    fediblockhole.np = numpy
+
+    merged = timed(
+        "merge_blocklists pct threshold",
+        merge_blocklists,
+        blocklists,
+        "max",
+        50,
+        "pct",
+    )
+    print(f"Merged {len(merged)} of {domains} domains.")
+
+
+if __name__ == "__main__":
+    main()
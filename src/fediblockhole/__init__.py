@@ -5,18 +5,49 @@ from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
+import heapq
 import json
-import os.path
+import os
 import sys
+import threading
 import time
 import urllib.request as urlr
+import zlib
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from importlib.metadata import version
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator
 
 import requests
 import toml
 
-from .blocklists import BlockAuditList, Blocklist, parse_blocklist
+from .audit import BlockAuditWriter
+from .blocklists import (
+    BlockAuditList,
+    Blocklist,
+    InternTable,
+    blocklist_digest,
+    deobfuscate_blocklists,
+    iter_bitset,
+    parse_blocklist,
+)
+from .changeset import BlockChange, Changeset
 from .const import BlockAudit, BlockSeverity, DomainBlock
+from .domaintrie import DomainTrie, collapse_subdomains, find_rejected_blocks
+from .followcache import FollowCache
+from .journal import PushJournal
+from .mirror import InstanceMirror
+from .pushstate import PushState
+from .ratelimit import RateLimiter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 __version__ = version("fediblockhole")
 
@@ -31,6 +62,9 @@ URL_BLOCKLIST_MAXSIZE = 1024**3
 # Wait at most this long for a remote server to respond
 REQUEST_TIMEOUT = 30
 
+# How many admin domain blocks to fetch per page when refreshing a mirror
+MIRROR_PAGE_LIMIT = 200
+
 # Time to wait between instance API calls to we don't melt them
 # The default Mastodon rate limit is 300 calls per 5 minutes
 API_CALL_DELAY = 5 * 60 / 300  # 300 calls per 5 minutes
@@ -71,6 +105,9 @@ def sync_blocklists(conf: argparse.Namespace):
     # Add extra export fields if defined in config
     export_fields.extend(conf.export_fields)
 
+    # Share domain and comment strings between all the blocklists we fetch
+    interns = InternTable()
+
     blocklists = []
     # Fetch blocklists from URLs
     if not conf.no_fetch_url:
@@ -81,6 +118,7 @@ def sync_blocklists(conf: argparse.Namespace):
                 conf.save_intermediate,
                 conf.savedir,
                 export_fields,
+                interns,
             )
         )
 
@@ -93,22 +131,48 @@ def sync_blocklists(conf: argparse.Namespace):
                 conf.save_intermediate,
                 conf.savedir,
                 export_fields,
+                interns,
             )
         )
 
-    # Merge blocklists into an update dict
-    merged = merge_blocklists(
-        blocklists,
-        conf.mergeplan,
-        conf.merge_threshold,
-        conf.merge_threshold_type,
-        conf.blocklist_auditfile,
+    log.info(
+        f"Interned {len(interns)} unique strings, "
+        f"saving {interns.bytes_saved} bytes across {interns.hits} duplicates."
     )
 
+    # Work out the real domains of obfuscated blocks, if we know them
+    deobfuscate_blocklists(blocklists)
+
+    # Merge blocklists into an update dict
+    if conf.merge_mode == "streaming":
+        merged = merge_blocklists_streaming(
+            blocklists,
+            conf.mergeplan,
+            conf.merge_threshold,
+            conf.merge_threshold_type,
+            conf.blocklist_auditfile,
+            conf.audit_detail,
+        )
+    else:
+        merged = merge_blocklists(
+            blocklists,
+            conf.mergeplan,
+            conf.merge_threshold,
+            conf.merge_threshold_type,
+            conf.blocklist_auditfile,
+            conf.audit_detail,
+        )
+
     # Remove items listed in allowlists, if any
     allowlists = fetch_allowlists(conf)
     merged = apply_allowlists(merged, conf, allowlists)
 
+    # Find subdomain blocks that a parent domain block already covers
+    collapsed = collapse_subdomains(merged, conf.collapse_subdomains)
+
+    # Report which blocklists contributed any domains we were asked about
+    explain_domains(merged, conf.explain_domains, collapsed)
+
     # Save the final mergelist, if requested
     if conf.blocklist_savefile:
         log.info(f"Saving merged blocklist to {conf.blocklist_savefile}")
@@ -116,15 +180,93 @@ def sync_blocklists(conf: argparse.Namespace):
 
     # Push the blocklist to destination instances
     if not conf.no_push_instance:
-        log.info("Pushing domain blocks to instances...")
-        for dest in conf.blocklist_instance_destinations:
-            target = dest["domain"]
-            token = dest["token"]
-            scheme = dest.get("scheme", "https")
-            max_followed_severity = BlockSeverity(
-                dest.get("max_followed_severity", "silence")
+        push_to_destinations(merged, conf, import_fields)
+
+
+def explain_domains(merged: Blocklist, domains: list, collapsed: dict):
+    """Log which blocklists contributed each domain, and if it was removed
+
+    Allowlists and collapsing subdomains remove blocks from the merged
+    blocklist, but not its record of the blocklists that contributed them.
+
+    @param merged: The merged blocklist, as it will be saved and pushed.
+    @param domains: The domains to explain.
+    @param collapsed: Each subdomain covered by a parent domain block, and
+        that parent domain, as returned by collapse_subdomains().
+    """
+    for domain in domains:
+        sources = merged.sources_for(domain)
+        if not sources:
+            log.info(f"'{domain}' is not in the merged blocklist.")
+            continue
+
+        log.info(f"'{domain}' is blocked by: {', '.join(sources)}")
+        if domain in collapsed:
+            if domain in merged.blocks:
+                log.info(
+                    f"'{domain}' is covered by the block for '{collapsed[domain]}'."
+                )
+            else:
+                log.info(
+                    f"'{domain}' was removed, as the block for "
+                    f"'{collapsed[domain]}' covers it."
+                )
+        elif domain not in merged.blocks:
+            log.info(f"'{domain}' was removed by an allowlist.")
+
+
+def push_to_destinations(
+    merged: Blocklist, conf: argparse.Namespace, import_fields: list
+) -> Counter:
+    """Push the merged blocklist to every destination instance
+
+    Each destination has its own rate limit, so up to `conf.push_concurrency`
+    destinations are pushed to at the same time. A failure to push to one
+    destination doesn't stop the others. Once they're all done, the first
+    error is raised again.
+
+    If `conf.push_state_file` is set, a destination is skipped when neither
+    the blocklist nor the instance's newest blocks have changed since the
+    last complete push to it.
+
+    @returns: a Counter of the combined push stats for every destination
+    """
+    destinations = conf.blocklist_instance_destinations
+    log.info(f"Pushing domain blocks to {len(destinations)} instances...")
+
+    def push_destination(dest: dict) -> Counter:
+        target = dest["domain"]
+        token = dest["token"]
+        scheme = dest.get("scheme", "https")
+        max_followed_severity = BlockSeverity(
+            dest.get("max_followed_severity", "silence")
+        )
+        plan_file = None
+        if conf.save_push_plan:
+            plan_file = os.path.join(conf.savedir, f"pushplan-{target}.json")
+        mirror_file = None
+        if conf.instance_mirror_dir:
+            mirror_file = os.path.join(
+                conf.instance_mirror_dir, f"mirror-{target}.json"
             )
-            push_blocklist(
+        journal_file = None
+        if conf.push_journal_dir:
+            journal_file = os.path.join(
+                conf.push_journal_dir, f"journal-{target}.jsonl"
+            )
+
+        newest_page = None
+        if push_state is not None:
+            digest = f"{merged_digest}:{max_followed_severity}"
+            # Without a recent push to compare with, a full push is needed anyway
+            if push_state.current(target):
+                newest_page = fetch_newest_blocks(target, token, scheme)
+                if push_state.unchanged(target, digest, page_digest(newest_page)):
+                    log.info(f"Nothing has changed for {target} since the last push.")
+                    return Counter()
+
+        try:
+            stats = push_blocklist(
                 token,
                 target,
                 merged,
@@ -133,27 +275,109 @@ def sync_blocklists(conf: argparse.Namespace):
                 max_followed_severity,
                 scheme,
                 conf.override_private_comment,
+                plan_file,
+                dest.get("max_in_flight", 1),
+                follow_cache,
+                mirror_file,
+                journal_file,
+                conf.push_time_budget,
+                conf.instance_mirror_max_age,
+                newest_page,
             )
+        except Exception:
+            if push_state is not None:
+                push_state.forget(target)
+            raise
+
+        if push_state is not None and not conf.dryrun:
+            if stats["deferred"]:
+                push_state.forget(target)
+            else:
+                # Probe again, to see the instance with our changes made
+                push_state.record(target, digest, probe_instance(target, token, scheme))
+        return stats
+
+    push_state = None
+    if conf.push_state_file:
+        push_state = PushState.load(conf.push_state_file, conf.push_verify_interval)
+        merged_digest = blocklist_digest(
+            merged.values(), sorted(import_fields), conf.override_private_comment
+        )
+
+    follow_cache = None
+    if conf.follow_cache_file:
+        follow_cache = FollowCache.load(
+            conf.follow_cache_file, conf.follow_cache_ttl, conf.follow_cache_max_stale
+        )
+
+    total = Counter(added=0, updated=0, unchanged=0, skipped=0, deferred=0)
+    errors = []
+    workers = max(1, min(conf.push_concurrency, len(destinations)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="push") as pool:
+            futures = {
+                pool.submit(push_destination, dest): dest for dest in destinations
+            }
+            for future in as_completed(futures):
+                target = futures[future]["domain"]
+                try:
+                    total.update(future.result())
+                except Exception as e:
+                    log.error(f"Failed to push blocklist to {target}: {e}")
+                    errors.append(e)
+    finally:
+        if follow_cache is not None:
+            follow_cache.close()
+        if push_state is not None:
+            push_state.save()
+
+    log.info(
+        f"Pushed blocklist to {len(destinations) - len(errors)} of "
+        f"{len(destinations)} instances: {total['added']} added, "
+        f"{total['updated']} updated, {total['unchanged']} unchanged, "
+        f"{total['skipped']} skipped, {total['deferred']} deferred."
+    )
+    if errors:
+        raise errors[0]
+    return total
 
 
 def apply_allowlists(merged: Blocklist, conf: argparse.Namespace, allowlists: dict):
-    """Apply allowlists"""
+    """Apply allowlists
+
+    All the allowed domains are compiled into a DomainTrie, so the merged
+    list is checked in a single pass no matter how large the allowlists are.
+    Each allowed domain records whether its subdomains are allowed too.
+    """
+    allowed = DomainTrie()
+
     # Apply allows specified on the commandline
     for domain in conf.allow_domains:
         log.info(f"'{domain}' allowed by commandline, removing any blocks...")
-        if domain in merged.blocks:
-            del merged.blocks[domain]
+        allowed.insert(domain, conf.allow_subdomains or allowed.get(domain, False))
 
     # Apply allows from URLs lists
     log.info("Removing domains from URL allowlists...")
     for alist in allowlists:
         log.debug(f"Processing allows from '{alist.origin}'...")
-        for allowed in alist.blocks.values():
-            domain = allowed.domain
+        include_subdomains = alist.include_subdomains
+        for domain in alist.blocks:
+            allowed.insert(domain, include_subdomains or allowed.get(domain, False))
+
+    if not len(allowed):
+        return merged
+
+    blocks = {}
+    for domain, block in merged.blocks.items():
+        if domain in allowed:
             log.debug(f"Removing allowlisted domain '{domain}' from merged list.")
-            if domain in merged.blocks:
-                del merged.blocks[domain]
+        elif any(subdomains for _, subdomains in allowed.parents(domain)):
+            log.debug(f"Removing subdomain '{domain}' of an allowlisted domain.")
+        else:
+            blocks[domain] = block
 
+    log.info(f"Removed {len(merged.blocks) - len(blocks)} allowlisted domains.")
+    merged.blocks = blocks
     return merged
 
 
@@ -166,6 +390,8 @@ def fetch_allowlists(conf: argparse.Namespace) -> Blocklist:
             conf.save_intermediate,
             conf.savedir,
         )
+        for alist, item in zip(allowlists, conf.allowlist_url_sources):
+            alist.include_subdomains = item.get("include_subdomains", False)
         return allowlists
     return Blocklist()
 
@@ -176,10 +402,12 @@ def fetch_from_urls(
     save_intermediate: bool = False,
     savedir: str = None,
     export_fields: list = EXPORT_FIELDS,
+    interns: InternTable = None,
 ) -> dict:
     """Fetch blocklists from URL sources
     @param blocklists: A dict of existing blocklists, keyed by source
     @param url_sources: A dict of configuration info for url sources
+    @param interns: An optional InternTable shared by all parsed blocklists
     @returns: A dict of blocklists, same as input, but (possibly) modified
     """
     log.info("Fetching domain blocks from URLs...")
@@ -196,7 +424,10 @@ def fetch_from_urls(
         listformat = item.get("format", "csv")
         with urlr.urlopen(url) as fp:
             rawdata = fp.read(URL_BLOCKLIST_MAXSIZE).decode("utf-8")
-            bl = parse_blocklist(rawdata, url, listformat, import_fields, max_severity)
+            bl = parse_blocklist(
+                rawdata, url, listformat, import_fields, max_severity, interns
+            )
+            bl.weight = source_weight(item)
             blocklists.append(bl)
             if save_intermediate:
                 save_intermediate_blocklist(bl, savedir, export_fields)
@@ -210,10 +441,12 @@ def fetch_from_instances(
     save_intermediate: bool = False,
     savedir: str = None,
     export_fields: list = EXPORT_FIELDS,
+    interns: InternTable = None,
 ) -> dict:
     """Fetch blocklists from other instances
     @param blocklists: A dict of existing blocklists, keyed by source
     @param url_sources: A dict of configuration info for url sources
+    @param interns: An optional InternTable shared by all parsed blocklists
     @returns: A dict of blocklists, same as input, but (possibly) modified
     """
     log.info("Fetching domain blocks from instances...")
@@ -231,19 +464,31 @@ def fetch_from_instances(
             # Ensure we always use the default fields
             import_fields = IMPORT_FIELDS.extend(source_import_fields)
 
-        bl = fetch_instance_blocklist(domain, token, admin, import_fields, scheme)
+        bl = fetch_instance_blocklist(
+            domain, token, admin, import_fields, scheme, interns
+        )
+        bl.weight = source_weight(item)
         blocklists.append(bl)
         if save_intermediate:
             save_intermediate_blocklist(bl, savedir, export_fields)
     return blocklists
 
 
+def source_weight(item: dict) -> float:
+    """Get the trust weight of a blocklist source from its configuration"""
+    weight = item.get("weight", 1)
+    if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight < 0:
+        raise ValueError(f"Invalid weight '{weight}'. Weights must be 0 or more.")
+    return float(weight)
+
+
 def merge_blocklists(
     blocklists: list[Blocklist],
     mergeplan: str = "max",
     threshold: int = 0,
     threshold_type: str = "count",
     save_block_audit_file: str = None,
+    audit_detail: bool = False,
 ) -> Blocklist:
     """Merge fetched remote blocklists into a bulk update
     @param blocklists: A dict of lists of DomainBlocks, keyed by source.
@@ -254,73 +499,285 @@ def merge_blocklists(
     @param threshold: An integer used in the threshold mechanism.
         If a domain is not present in this number/pct or more of the blocklists,
         it will not get merged into the final list.
-    @param threshold_type: choice of ['count', 'pct']
+    @param threshold_type: choice of ['count', 'pct', 'weighted']
         If `count`, threshold is met if block is present in `threshold`
         or more blocklists.
         If `pct`, theshold is met if block is present in
         count_of_mentions / number_of_blocklists.
+        If `weighted`, threshold is met if the sum of the `weight` of each
+        blocklist the block is present in is `threshold` or more.
+    @param save_block_audit_file: Save an audit record for every domain here.
+    @param audit_detail: Add the merged severity, and which blocklists
+        contributed each domain, to the audit file.
     @param returns: A dict of DomainBlocks keyed by domain
     """
-    merged = Blocklist("fediblockhole.merge_blocklists")
-    audit = BlockAuditList("fediblockhole.merge_blocklists")
+    origins = [bl.origin for bl in blocklists]
+    weights = [bl.weight for bl in blocklists]
+    merged = Blocklist("fediblockhole.merge_blocklists", sources=origins)
 
     num_blocklists = len(blocklists)
 
-    # Create a domain keyed list of blocks for each domain
-    domain_blocks = {}
-
-    for bl in blocklists:
-        for block in bl.values():
-            if "*" in block.domain:
-                log.debug(f"Domain '{block.domain}' is obfuscated. Skipping it.")
+    # Count how many blocklists mention each domain, add up their weights,
+    # and record which ones as a bitset of blocklist indices.
+    # Domains are numbered in the order we first see them.
+    domain_index = {}
+    counts = array("L")
+    scores = array("d")
+    membership = []
+    for i, bl in enumerate(blocklists):
+        bit = 1 << i
+        weight = weights[i]
+        for domain in bl.blocks:
+            if "*" in domain:
+                log.debug(f"Domain '{domain}' is obfuscated. Skipping it.")
                 continue
-            elif block.domain in domain_blocks:
-                domain_blocks[block.domain].append(block)
+            idx = domain_index.get(domain)
+            if idx is None:
+                domain_index[domain] = len(counts)
+                counts.append(1)
+                scores.append(weight)
+                membership.append(bit)
             else:
-                domain_blocks[block.domain] = [
-                    block,
-                ]
-
-    # Only merge items if `threshold` is met or exceeded
-    for domain in domain_blocks:
-        domain_matches_count = len(domain_blocks[domain])
-        domain_matches_percent = domain_matches_count / num_blocklists * 100
-        if threshold_type == "count":
-            domain_threshold_level = domain_matches_count
-        elif threshold_type == "pct":
-            domain_threshold_level = domain_matches_percent
-            # log.debug(f"domain threshold level: {domain_threshold_level}")
-        else:
-            raise ValueError(
-                f"Unsupported threshold type '{threshold_type}'. Supported values are: 'count', 'pct'"  # noqa
-            )
+                counts[idx] += 1
+                scores[idx] += weight
+                membership[idx] |= bit
 
-        log.debug(f"Checking if {domain_threshold_level} >= {threshold} for {domain}")
-        if domain_threshold_level >= threshold:
-            # Add first block in the list to merged
-            block = domain_blocks[domain][0]
-            log.debug(f"Yes. Merging block: {block}")
-
-            # Merge the others with this record
-            for newblock in domain_blocks[domain][1:]:
-                block = apply_mergeplan(block, newblock, mergeplan)
-            merged.blocks[block.domain] = block
-
-        if save_block_audit_file:
-            blockdata: BlockAudit = {
-                "domain": domain,
-                "count": domain_matches_count,
-                "percent": domain_matches_percent,
-            }
-            audit.blocks[domain] = blockdata
+    # Only merge items if `threshold` is met or exceeded.
+    # Check every domain at once, before merging any of them.
+    passed = threshold_mask(counts, num_blocklists, threshold, threshold_type, scores)
+
+    # Create a domain keyed list of blocks for each domain that passed
+    domain_blocks = {}
+    for bl in blocklists:
+        for domain, block in bl.items():
+            idx = domain_index.get(domain)
+            if idx is not None and passed[idx]:
+                if domain in domain_blocks:
+                    domain_blocks[domain].append(block)
+                else:
+                    domain_blocks[domain] = [block]
+
+    # Merge all the blocks for each domain in one go
+    for domain, blocks in domain_blocks.items():
+        merged.blocks[domain] = merge_blocks(blocks, mergeplan)
+        merged.membership[domain] = membership[domain_index[domain]]
 
     if save_block_audit_file:
-        log.info(f"Saving audit file to {save_block_audit_file}")
-        save_domain_block_audit_to_file(audit, save_block_audit_file)
+        with BlockAuditWriter(save_block_audit_file, origins, audit_detail) as audit:
+            for domain, idx in domain_index.items():
+                blockdata = audit_record(domain, membership[idx], origins, weights)
+                audit.write(blockdata, membership[idx], merged.blocks.get(domain))
+
+    return merged
+
+
+def threshold_mask(
+    counts: array,
+    num_blocklists: int,
+    threshold: int = 0,
+    threshold_type: str = "count",
+    scores: array = None,
+):
+    """Check the merge threshold for many domains at once
+
+    Uses NumPy if it's installed, and plain Python otherwise.
+
+    @param counts: An array of how many blocklists mention each domain.
+    @param num_blocklists: The total number of blocklists being merged.
+    @param threshold: The threshold, as for merge_blocklists.
+    @param threshold_type: The threshold type, as for merge_blocklists.
+    @param scores: An array of the weighted score of each domain.
+        Required for the 'weighted' threshold type.
+    @returns: a sequence of flags, true for each domain that met the threshold.
+    """
+    if threshold_type not in ["count", "pct", "weighted"]:
+        raise ValueError(
+            f"Unsupported threshold type '{threshold_type}'. Supported values are: 'count', 'pct', 'weighted'"  # noqa
+        )
+
+    if threshold_type == "weighted" and scores is None:
+        raise ValueError("The 'weighted' threshold type needs domain scores.")
+
+    if np is not None:
+        if threshold_type == "weighted":
+            return np.asarray(scores) >= threshold
+        levels = np.asarray(counts)
+        if threshold_type == "pct":
+            levels = levels / num_blocklists * 100
+        return levels >= threshold
+
+    if threshold_type == "weighted":
+        return array("B", (score >= threshold for score in scores))
+    if threshold_type == "pct":
+        return array(
+            "B", (count / num_blocklists * 100 >= threshold for count in counts)
+        )
+    return array("B", (count >= threshold for count in counts))
+
+
+def merge_blocklists_streaming(
+    blocklists: list[Blocklist],
+    mergeplan: str = "max",
+    threshold: int = 0,
+    threshold_type: str = "count",
+    save_block_audit_file: str = None,
+    audit_detail: bool = False,
+) -> Blocklist:
+    """Merge fetched remote blocklists with a k-way merge in domain order
+
+    Gives the same blocks as merge_blocklists, but doesn't build a list of
+    every block for every domain first. Each domain is merged as soon as
+    every blocklist has moved past it, so the merged list is in domain order.
+
+    Parameters are the same as for merge_blocklists.
+    """
+    origins = [bl.origin for bl in blocklists]
+    weights = [bl.weight for bl in blocklists]
+    merged = Blocklist("fediblockhole.merge_blocklists", sources=origins)
+
+    sources = [bl.iter_sorted() for bl in blocklists]
+    with BlockAuditWriter(save_block_audit_file, origins, audit_detail) as audit:
+        for block, membership, blockdata in iter_merged_blocks(
+            sources, mergeplan, threshold, threshold_type, origins, weights
+        ):
+            if block is not None:
+                merged.blocks[block.domain] = block
+                merged.membership[block.domain] = membership
+
+            audit.write(blockdata, membership, block)
 
     return merged
 
 
+def iter_merged_blocks(
+    sources: list[Iterable[DomainBlock]],
+    mergeplan: str = "max",
+    threshold: int = 0,
+    threshold_type: str = "count",
+    origins: list[str] = None,
+    weights: list[float] = None,
+) -> Iterator[tuple[DomainBlock, int, BlockAudit]]:
+    """Merge domain-sorted streams of blocks, one domain at a time
+
+    Only holds the next block from each source, plus the blocks for the
+    domain currently being merged, so memory use scales with the number
+    of sources rather than the number of blocks.
+
+    @param sources: One iterable of DomainBlocks per blocklist.
+        Each must yield its blocks sorted by domain.
+    @param origins: The origin of each source, for the audit records.
+    @param weights: The weight of each source. Defaults to 1 for each.
+    @returns: an iterator of (merged block, membership bitset, audit record)
+        tuples, as for merge_domain(), in domain order.
+    """
+    if origins is None:
+        origins = [str(i) for i in range(len(sources))]
+
+    # Tag each block with its source index. Ties on the domain are then
+    # broken in source order, so blocks for the same domain arrive in the
+    # same order as they do in merge_blocklists.
+    def tag(source, i):
+        for block in source:
+            yield block.domain, i, block
+
+    tagged = [tag(source, i) for i, source in enumerate(sources)]
+    stream = heapq.merge(*tagged, key=itemgetter(0, 1))
+    for domain, items in groupby(stream, key=itemgetter(0)):
+        if "*" in domain:
+            log.debug(f"Domain '{domain}' is obfuscated. Skipping it.")
+            continue
+
+        blocks = []
+        membership = 0
+        for _, i, block in items:
+            blocks.append(block)
+            membership |= 1 << i
+
+        block, blockdata = merge_domain(
+            domain,
+            blocks,
+            membership,
+            origins,
+            mergeplan,
+            threshold,
+            threshold_type,
+            weights,
+        )
+        yield block, membership, blockdata
+
+
+def audit_record(
+    domain: str, membership: int, origins: list[str], weights: list[float] = None
+) -> BlockAudit:
+    """Build the audit record for a domain from its membership bitset
+
+    @param domain: The domain being audited.
+    @param membership: A bitset of the indices of blocklists with the domain.
+    @param origins: The origin of each blocklist being merged.
+    @param weights: The weight of each blocklist. Defaults to 1 for each.
+    """
+    indices = list(iter_bitset(membership))
+    if weights is None:
+        score = float(len(indices))
+    else:
+        score = 0.0
+        for i in indices:
+            score += weights[i]
+
+    return BlockAudit(
+        domain,
+        len(indices),
+        len(indices) / len(origins) * 100,
+        score,
+        " ".join(origins[i] for i in indices),
+    )
+
+
+def merge_domain(
+    domain: str,
+    blocks: list[DomainBlock],
+    membership: int,
+    origins: list[str],
+    mergeplan: str = "max",
+    threshold: int = 0,
+    threshold_type: str = "count",
+    weights: list[float] = None,
+) -> tuple[DomainBlock, BlockAudit]:
+    """Merge the blocks for a domain if it meets the merge threshold
+
+    @param domain: The domain being merged.
+    @param blocks: The blocks for the domain from each blocklist, in order.
+    @param membership: A bitset of the indices of blocklists with the domain.
+    @param origins: The origin of each blocklist being merged.
+    @param weights: The weight of each blocklist. Defaults to 1 for each.
+    @returns: a tuple of the merged block, or None if the threshold wasn't
+        met, and the audit record for the domain.
+    """
+    blockdata = audit_record(domain, membership, origins, weights)
+    domain_matches_count = blockdata.count
+    domain_matches_percent = blockdata.percent
+    if threshold_type == "count":
+        domain_threshold_level = domain_matches_count
+    elif threshold_type == "pct":
+        domain_threshold_level = domain_matches_percent
+        # log.debug(f"domain threshold level: {domain_threshold_level}")
+    elif threshold_type == "weighted":
+        domain_threshold_level = blockdata.score
+    else:
+        raise ValueError(
+            f"Unsupported threshold type '{threshold_type}'. Supported values are: 'count', 'pct', 'weighted'"  # noqa
+        )
+
+    block = None
+    log.debug(f"Checking if {domain_threshold_level} >= {threshold} for {domain}")
+    if domain_threshold_level >= threshold:
+        # Merge all the blocks for this domain in one go
+        block = merge_blocks(blocks, mergeplan)
+        log.debug(f"Yes. Merged block: {block}")
+
+    return block, blockdata
+
+
 def apply_mergeplan(
     oldblock: DomainBlock, newblock: DomainBlock, mergeplan: str = "max"
 ) -> dict:
@@ -330,60 +787,151 @@ def apply_mergeplan(
     @param newblock: The new block definition we want to merge in.
     @param mergeplan: How to merge. Choices are 'max', the default, and 'min'.
     """
-    # Default to the existing block definition
-    blockdata = oldblock._asdict()
+    return merge_blocks([oldblock, newblock], mergeplan)
 
-    # Merge comments
-    keylist = ["public_comment", "private_comment"]
-    for key in keylist:
-        try:
-            oldcomment = getattr(oldblock, key)
-            newcomment = getattr(newblock, key)
-            blockdata[key] = merge_comments(oldcomment, newcomment)
-        except KeyError:
-            log.debug(
-                f"Key '{key}' missing from block definition so cannot compare. Continuing..."  # noqa
-            )
-            continue
 
-    # How do we override an earlier block definition?
-    if mergeplan in ["max", None]:
-        # Use the highest block level found (the default)
-        # log.debug(f"Using 'max' mergeplan.")
-
-        if newblock.severity > oldblock.severity:
-            # log.debug(f"New block severity is higher. Using that.")
-            blockdata["severity"] = newblock.severity
-
-        # For 'reject_media', 'reject_reports', and 'obfuscate' if
-        # the value is set and is True for the domain in
-        # any blocklist then the value is set to True.
-        for key in ["reject_media", "reject_reports", "obfuscate"]:
-            newval = getattr(newblock, key)
-            if newval is True:
-                blockdata[key] = True
-
-    elif mergeplan in ["min"]:
-        # Use the lowest block level found
-        log.debug("Using 'min' mergeplan.")
-
-        if newblock.severity < oldblock.severity:
-            blockdata["severity"] = newblock.severity
-
-        # For 'reject_media', 'reject_reports', and 'obfuscate' if
-        # the value is set and is False for the domain in
-        # any blocklist then the value is set to False.
-        for key in ["reject_media", "reject_reports", "obfuscate"]:
-            newval = getattr(newblock, key)
-            if newval is False:
-                blockdata[key] = False
+def merge_blocks(blocks: list[DomainBlock], mergeplan: str = "max") -> DomainBlock:
+    """Use a mergeplan to merge all the block definitions for a domain
 
-    else:
+    Gives the same result as folding the blocks together pairwise, but
+    accumulates severity, flags and comments in a single pass and only
+    builds one new DomainBlock.
+
+    @param blocks: The block definitions to merge, in source order.
+    @param mergeplan: How to merge. Choices are 'max', the default, and 'min'.
+    @returns: the merged block, or the only block if there's just one.
+    """
+    if mergeplan not in ["max", "min", None]:
         raise NotImplementedError(f"Mergeplan '{mergeplan}' not implemented.")
 
-    # log.debug(f"Block severity set to {blockdata['severity']}")
+    # Default to the first block definition
+    first = blocks[0]
+    if len(blocks) == 1:
+        return first
+
+    severity = first.severity
+    public_comment = CommentMerger(first.public_comment)
+    private_comment = CommentMerger(first.private_comment)
+    reject_media = first.reject_media
+    reject_reports = first.reject_reports
+    obfuscate = first.obfuscate
+
+    for newblock in islice(blocks, 1, None):
+        public_comment.add(newblock.public_comment)
+        private_comment.add(newblock.private_comment)
+
+        # How do we override an earlier block definition?
+        if mergeplan == "min":
+            # Use the lowest block level found
+            if newblock.severity < severity:
+                severity = newblock.severity
+
+            # For 'reject_media', 'reject_reports', and 'obfuscate' if
+            # the value is set and is False for the domain in
+            # any blocklist then the value is set to False.
+            if newblock.reject_media is False:
+                reject_media = False
+            if newblock.reject_reports is False:
+                reject_reports = False
+            if newblock.obfuscate is False:
+                obfuscate = False
+
+        else:
+            # Use the highest block level found (the default)
+            if newblock.severity > severity:
+                severity = newblock.severity
+
+            # For 'reject_media', 'reject_reports', and 'obfuscate' if
+            # the value is set and is True for the domain in
+            # any blocklist then the value is set to True.
+            if newblock.reject_media is True:
+                reject_media = True
+            if newblock.reject_reports is True:
+                reject_reports = True
+            if newblock.obfuscate is True:
+                obfuscate = True
+
+    return DomainBlock(
+        first.domain,
+        severity,
+        public_comment.merged(),
+        private_comment.merged(),
+        reject_media,
+        reject_reports,
+        obfuscate,
+        first.id,
+    )
+
+
+class CommentMerger(object):
+    """Merge many comments into one, a comment at a time
+
+    We want to skip duplicate fragments so we don't end up
+    re-concatenating the same strings every time there's an
+    update, causing the comment to grow without bound.
+    We tokenize the comments, splitting them on ', ', and skip the
+    tokens we already have, keeping a count of each token so the check
+    doesn't have to search the list of tokens.
+    This means "boring, lack of moderation, nazis, scrapers" merging
+    with "lack of moderation, scrapers" should result in
+    "boring, lack of moderation, nazis, scrapers"
 
-    return DomainBlock(**blockdata)
+    The result is the same as merging the comments pairwise, one after
+    another, with the original list-based merge. So a token repeated
+    within a comment is only skipped as many times as we already have it.
+
+    Empty comments are ignored, and a comment that is only ever seen
+    on its own, or repeated exactly, is returned unchanged.
+    """
+
+    def __init__(self, comment: str = None):
+        self.first = None
+        self.tokens = None
+        self.counts = {}
+        self.add(comment)
+
+    def add(self, comment: str):
+        """Merge in another comment"""
+        # Don't merge if the comment is None or ''
+        if not comment:
+            return
+
+        if self.tokens is None:
+            # If there's no comment yet, just keep this one
+            if self.first is None:
+                self.first = comment
+                return
+            # If both comments are the same, don't merge
+            if comment == self.first:
+                return
+            self.tokens = []
+            self._add_tokens(self.first)
+
+        self._add_tokens(comment)
+
+    def _add_tokens(self, comment: str):
+        # The first occurrences of each token we already have are duplicates,
+        # and any further occurrences are new
+        new_tokens = []
+        seen = {}
+        for token in comment.split(", "):
+            if token:
+                occurrence = seen.get(token, 0)
+                seen[token] = occurrence + 1
+                if occurrence >= self.counts.get(token, 0):
+                    new_tokens.append(token)
+
+        for token in new_tokens:
+            self.tokens.append(token)
+            self.counts[token] = self.counts.get(token, 0) + 1
+
+    def merged(self) -> str:
+        """Return the merged comment"""
+        if self.tokens is not None:
+            return ", ".join(self.tokens)
+        if self.first is None:
+            return ""
+        return self.first
 
 
 def merge_comments(oldcomment: str, newcomment: str) -> str:
@@ -393,46 +941,9 @@ def merge_comments(oldcomment: str, newcomment: str) -> str:
     @param newcomment: The new commment we want to merge in
     @returns: a new str of the merged comment
     """
-    # Don't merge if both comments are None or ''
-    if oldcomment in ["", None] and newcomment in ["", None]:
-        return ""
-
-    # If both comments are the same, or new comment is empty, don't merge
-    if oldcomment == newcomment or newcomment in ["", None]:
-        return oldcomment
-
-    # If old comment is empty, just return the new one
-    if oldcomment in ["", None]:
-        return newcomment
-
-    # We want to skip duplicate fragments so we don't end up
-    # re-concatenating the same strings every time there's an
-    # update, causing the comment to grow without bound.
-    # We tokenize the comments, splitting them on ', ', and comparing
-    # the tokens, skipping duplicates.
-    # This means "boring, lack of moderation, nazis, scrapers" merging
-    # with "lack of moderation, scrapers" should result in
-    # "boring, lack of moderation, nazis, scrapers"
-    old_tokens = oldcomment.split(", ")
-    new_tokens = newcomment.split(", ")
-
-    # Remove any empty string tokens that we get
-    while "" in old_tokens:
-        old_tokens.remove("")
-    while "" in new_tokens:
-        new_tokens.remove("")
-
-    # Remove duplicate tokens
-    for token in old_tokens:
-        if token in new_tokens:
-            new_tokens.remove(token)
-
-    # Combine whatever tokens are left into one set
-    tokenset = old_tokens
-    tokenset.extend(new_tokens)
-
-    # Return the merged string
-    return ", ".join(tokenset)
+    merger = CommentMerger(oldcomment)
+    merger.add(newcomment)
+    return merger.merged()
 
 
 def requests_headers(token: str = None):
@@ -450,6 +961,7 @@ def fetch_instance_blocklist(
     admin: bool = False,
     import_fields: list = ["domain", "severity"],
     scheme: str = "https",
+    interns: InternTable = None,
 ) -> list[DomainBlock]:
     """Fetch existing block list from server
 
@@ -457,6 +969,7 @@ def fetch_instance_blocklist(
     @param token: The (optional) OAuth Bearer token to authenticate with.
     @param admin: Boolean flag to use the admin API if True.
     @param import_fields: A list of fields to import from the remote instance.
+    @param interns: An optional InternTable to share strings with other lists.
     @returns: A list of the domain blocks from the instance.
     """
     log.info(f"Fetching instance blocklist from {host} ...")
@@ -468,9 +981,24 @@ def fetch_instance_blocklist(
         api_path = "/api/v1/instance/domain_blocks"
         parse_format = "mastodon_api_public"
 
-    headers = requests_headers(token)
-
     url = f"{scheme}://{host}{api_path}"
+    blockdata = fetch_instance_blockdata(url, token)
+
+    blocklist = parse_blocklist(
+        blockdata, url, parse_format, import_fields, interns=interns
+    )
+
+    return blocklist
+
+
+def fetch_instance_blockdata(url: str, token: str = None) -> list[dict]:
+    """Fetch every page of domain blocks from an instance API endpoint
+
+    @param url: The URL of the first page of domain blocks.
+    @param token: The (optional) OAuth Bearer token to authenticate with.
+    @returns: A list of the domain blocks, as dicts.
+    """
+    headers = requests_headers(token)
 
     blockdata = []
     link = True
@@ -502,9 +1030,116 @@ def fetch_instance_blocklist(
             urlstring, rel = next.split("; ")
             url = urlstring.strip("<").rstrip(">")
 
-    blocklist = parse_blocklist(blockdata, url, parse_format, import_fields)
+    return blockdata
 
-    return blocklist
+
+def fetch_admin_blocks_page(
+    host: str, token: str, scheme: str = "https", params: dict = None
+) -> list[dict]:
+    """Fetch a single page of admin domain blocks from an instance
+
+    @param params: Query parameters, such as `limit` and `min_id`.
+    @returns: A list of the domain blocks, as dicts.
+    """
+    url = f"{scheme}://{host}/api/v1/admin/domain_blocks"
+    response = requests.get(
+        url, headers=requests_headers(token), params=params, timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code != 200:
+        log.error(f"Cannot fetch remote blocklist: {response.content}")
+        raise ValueError("Unable to fetch domain block list: %s", response)
+    return json.loads(response.content.decode("utf-8"))
+
+
+def fetch_newest_blocks(host: str, token: str, scheme: str = "https") -> list:
+    """Fetch the newest page of an instance's admin domain blocks"""
+    return fetch_admin_blocks_page(host, token, scheme, {"limit": MIRROR_PAGE_LIMIT})
+
+
+def page_digest(page: list) -> str:
+    """A digest of a page of admin domain blocks
+
+    Adding, changing, or removing any of the blocks changes the digest.
+    """
+    data = json.dumps(page, sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def probe_instance(host: str, token: str, scheme: str = "https") -> str:
+    """A digest of the newest page of an instance's admin domain blocks"""
+    return page_digest(fetch_newest_blocks(host, token, scheme))
+
+
+def refresh_mirror(
+    mirror: InstanceMirror,
+    host: str,
+    token: str,
+    scheme: str = "https",
+    newest_page: list = None,
+):
+    """Bring a mirror of an instance's admin domain blocks up to date
+
+    Usually takes a single request. The newest page of blocks is fetched, and
+    any blocks newer than the mirror knows about are added to it. If there are
+    more new blocks than fit on a page, the rest are fetched with `min_id`.
+    If the newest page then doesn't match the mirror, because blocks were
+    changed or removed by someone else, every block is fetched again. Every
+    block is also fetched again once the mirror is stale, to catch changes to
+    older blocks.
+
+    @param newest_page: The newest page of blocks, if it was just fetched
+        already, so it isn't fetched again.
+    """
+    url = f"{scheme}://{host}/api/v1/admin/domain_blocks"
+    if not len(mirror):
+        log.info(f"No mirror of {host} yet. Fetching every block...")
+        mirror.replace(fetch_instance_blockdata(url, token))
+        return
+    if mirror.is_stale():
+        log.info(f"Mirror of {host} is due a full refresh. Fetching every block...")
+        mirror.replace(fetch_instance_blockdata(url, token))
+        return
+
+    known = mirror.max_id()
+    page = newest_page
+    if page is None:
+        page = fetch_newest_blocks(host, token, scheme)
+    new = [item for item in page if int(item["id"]) > known]
+    mirror.update(new)
+
+    # Fetch any new blocks that didn't fit on the newest page
+    if len(page) == MIRROR_PAGE_LIMIT and len(new) == len(page):
+        cursor = known
+        while True:
+            older = fetch_admin_blocks_page(
+                host, token, scheme, {"limit": MIRROR_PAGE_LIMIT, "min_id": cursor}
+            )
+            mirror.update(older)
+            if len(older) < MIRROR_PAGE_LIMIT:
+                break
+            cursor = max(int(item["id"]) for item in older)
+
+    if mirror.matches(page, MIRROR_PAGE_LIMIT):
+        log.info(f"Mirror of {host} is up to date with {len(new)} new blocks.")
+        return
+
+    log.warning(f"Mirror of {host} doesn't match the instance. Fetching every block...")
+    mirror.replace(fetch_instance_blockdata(url, token))
+
+
+def fetch_mirrored_blocklist(
+    host: str,
+    token: str,
+    mirror: InstanceMirror,
+    import_fields: list = ["domain", "severity"],
+    scheme: str = "https",
+    newest_page: list = None,
+) -> Blocklist:
+    """Fetch an instance's admin blocklist through a local mirror"""
+    log.info(f"Refreshing mirror of instance blocklist from {host} ...")
+    refresh_mirror(mirror, host, token, scheme, newest_page)
+    url = f"{scheme}://{host}/api/v1/admin/domain_blocks"
+    return parse_blocklist(mirror.blockdata(), url, "json", import_fields)
 
 
 def delete_block(token: str, host: str, id: int, scheme: str = "https"):
@@ -519,7 +1154,7 @@ def delete_block(token: str, host: str, id: int, scheme: str = "https"):
     )
     if response.status_code != 200:
         if response.status_code == 404:
-            log.warning(f"No such domain block: {id}")
+            log.warning(f"No such domain block at {host}: {id}")
             return
 
         raise ValueError(
@@ -568,26 +1203,55 @@ def fetch_instance_follows(
     return follows
 
 
-def check_followed_severity(
-    host: str,
+def get_instance_follows(
     token: str,
+    host: str,
+    domain: str,
+    scheme: str = "https",
+    follow_cache: FollowCache = None,
+    limiter: RateLimiter = None,
+) -> int:
+    """Get the followers of the target domain at the instance, using a cache
+
+    Fresh cached counts are used as they are. Stale cached counts are used
+    too, but refreshed in the background for next time. Otherwise the count
+    is fetched from the instance.
+
+    @param follow_cache: An optional FollowCache of recent follow counts.
+    @param limiter: An optional RateLimiter shared with other API calls to the
+        instance. If not provided, wait API_CALL_DELAY after each call.
+    @returns: int, number of local followers of remote instance accounts
+    """
+
+    def fetch() -> int:
+        if limiter is not None:
+            limiter.acquire()
+            return fetch_instance_follows(token, host, domain, scheme)
+        follows = fetch_instance_follows(token, host, domain, scheme)
+        time.sleep(API_CALL_DELAY)
+        return follows
+
+    if follow_cache is None:
+        return fetch()
+
+    follows, fresh = follow_cache.get(host, domain)
+    if follows is None:
+        follows = fetch()
+        follow_cache.set(host, domain, follows)
+    elif not fresh:
+        log.debug(f"Using stale follows for {domain} at {host} while refreshing.")
+        follow_cache.revalidate(host, domain, fetch)
+    return follows
+
+
+def limit_followed_severity(
+    host: str,
     domain: str,
     severity: BlockSeverity,
+    follows: int,
     max_followed_severity: BlockSeverity = BlockSeverity("silence"),
-    scheme: str = "https",
-):
-    """Check an instance to see if it has followers of a to-be-blocked instance"""
-
-    log.debug("Checking followed severity...")
-    # Return straight away if we're not increasing the severity
-    if severity <= max_followed_severity:
-        return severity
-
-    # If the instance has accounts that follow people on the to-be-blocked domain,
-    # limit the maximum severity to the configured `max_followed_severity`.
-    log.debug("checking for instance follows...")
-    follows = fetch_instance_follows(token, host, domain, scheme)
-    time.sleep(API_CALL_DELAY)
+) -> BlockSeverity:
+    """Limit the severity of a block if the instance has followers at the domain"""
     if follows > 0:
         log.debug(f"Instance {host} has {follows} followers of accounts at {domain}.")
         if severity > max_followed_severity:
@@ -600,14 +1264,26 @@ def check_followed_severity(
 
 
 def is_change_needed(oldblock: dict, newblock: dict, import_fields: list):
-    change_needed = oldblock.compare_fields(newblock, import_fields)
+    """Find which imported fields differ between two blocks
+
+    Only the fields we imported are compared. Fields we didn't import, such
+    as a private_comment or the server's block 'id', would otherwise always
+    look different and trigger needless updates.
+
+    @returns: a list of the fields that are different
+    """
+    fields = [field for field in DomainBlock.fields if field in import_fields]
+    change_needed = oldblock.compare_fields(newblock, fields)
     return change_needed
 
 
 def update_known_block(
     token: str, host: str, block: DomainBlock, scheme: str = "https"
-):
-    """Update an existing domain block with information in blockdict"""
+) -> dict:
+    """Update an existing domain block with information in blockdict
+
+    @returns: the updated block, as returned by the instance.
+    """
     api_path = "/api/v1/admin/domain_blocks/"
 
     id = block.id
@@ -623,10 +1299,17 @@ def update_known_block(
         raise ValueError(
             f"Something went wrong: {response.status_code}: {response.content}"
         )
+    return response.json()
 
 
-def add_block(token: str, host: str, blockdata: DomainBlock, scheme: str = "https"):
-    """Block a domain on Mastodon host"""
+def add_block(
+    token: str, host: str, blockdata: DomainBlock, scheme: str = "https"
+) -> dict:
+    """Block a domain on Mastodon host
+
+    @returns: the new block, as returned by the instance, or None if the
+        instance refused it because a stricter block already exists.
+    """
     log.debug(f"Adding block entry for {blockdata.domain} at {host}...")
     api_path = "/api/v1/admin/domain_blocks"
 
@@ -641,13 +1324,15 @@ def add_block(token: str, host: str, blockdata: DomainBlock, scheme: str = "http
     if response.status_code == 422:
         # A stricter block already exists. Probably for the base domain.
         err = json.loads(response.content)
-        log.warning(err["error"])
+        log.warning(f"{host} refused block for {blockdata.domain}: {err['error']}")
+        return None
 
     elif response.status_code != 200:
 
         raise ValueError(
             f"Something went wrong: {response.status_code}: {response.content}"
         )
+    return response.json()
 
 
 def push_blocklist(
@@ -659,110 +1344,493 @@ def push_blocklist(
     max_followed_severity: BlockSeverity = BlockSeverity("silence"),
     scheme: str = "https",
     override_private_comment: str = None,
+    plan_file: str = None,
+    max_in_flight: int = 1,
+    follow_cache: FollowCache = None,
+    mirror_file: str = None,
+    journal_file: str = None,
+    time_budget: float = None,
+    mirror_max_age: float = 86400,
+    newest_page: list = None,
 ):
     """Push a blocklist to a remote instance.
 
     Updates existing entries if they exist, creates new blocks if they don't.
+    Works out every change first with plan_push(), then applies them with
+    execute_changeset().
 
     @param token: The Bearer token for OAUTH API authentication
     @param host: The instance host, FQDN or IP
     @param blocklist: A list of block definitions. They must include the domain.
     @param import_fields: A list of fields to import to the instances.
+    @param plan_file: If provided, save the planned changes here as JSON.
+    @param max_in_flight: The most API writes to have in flight at once.
+    @param follow_cache: An optional FollowCache of recent follow counts.
+    @param mirror_file: If provided, keep a mirror of the instance's blocks
+        here, to avoid fetching all of them every time.
+    @param journal_file: If provided, journal the changes made here, so an
+        interrupted push can resume where it left off.
+    @param time_budget: If provided, stop starting new changes this many
+        seconds after the push starts, leaving the rest for the next run.
+    @param mirror_max_age: How many seconds before every block is fetched
+        into the mirror again.
+    @param newest_page: The instance's newest page of blocks, if it was just
+        fetched already, to refresh the mirror with.
+    @returns: a Counter of blocks 'added', 'updated', left 'unchanged',
+        'skipped' and 'deferred'
     """
     log.info(f"Pushing blocklist to host {host} ...")
+    deadline = None
+    if time_budget:
+        deadline = time.monotonic() + time_budget
+    mirror = None
+    if mirror_file:
+        mirror = InstanceMirror.load(mirror_file, host, mirror_max_age)
+    journal = None
+    if journal_file:
+        key = blocklist_digest(
+            blocklist.values(),
+            sorted(import_fields),
+            max_followed_severity,
+            override_private_comment,
+        )
+        journal = PushJournal.load(journal_file, host, key)
+
+    try:
+        stats = plan_and_execute(
+            token,
+            host,
+            blocklist,
+            dryrun,
+            import_fields,
+            max_followed_severity,
+            scheme,
+            override_private_comment,
+            plan_file,
+            max_in_flight,
+            follow_cache,
+            mirror,
+            journal,
+            deadline,
+            newest_page=newest_page,
+        )
+        # Every change has been made, so there's nothing left to resume
+        if journal is not None and not dryrun and not stats["deferred"]:
+            journal.discard()
+    finally:
+        if journal is not None:
+            journal.close()
+        if mirror is not None:
+            mirror.save(mirror_file)
+
+    log.info(
+        f"Pushed blocklist to {host}: {stats['added']} added, "
+        f"{stats['updated']} updated, {stats['unchanged']} unchanged, "
+        f"{stats['skipped']} skipped, {stats['deferred']} deferred."
+    )
+    return stats
+
+
+def plan_and_execute(
+    token: str,
+    host: str,
+    blocklist: list[DomainBlock],
+    dryrun: bool = False,
+    import_fields: list = ["domain", "severity"],
+    max_followed_severity: BlockSeverity = BlockSeverity("silence"),
+    scheme: str = "https",
+    override_private_comment: str = None,
+    plan_file: str = None,
+    max_in_flight: int = 1,
+    follow_cache: FollowCache = None,
+    mirror: InstanceMirror = None,
+    journal: PushJournal = None,
+    deadline: float = None,
+    limiter: RateLimiter = None,
+    newest_page: list = None,
+) -> Counter:
+    """Plan the changes to push a blocklist to an instance, then apply them
+
+    Parameters are the same as for push_blocklist, except that `mirror` is
+    the InstanceMirror to use, if any, and `journal` is the PushJournal. Blocks
+    written to the instance are recorded in both as they're written. No more
+    changes are started after `deadline`, a time.monotonic() time.
+
+    Every API call to the instance, while planning, while writing, and to
+    refresh stale follow counts in the background, shares the one `limiter`.
+
+    If the journal holds an unfinished push of the same blocklist, the push
+    isn't planned again. Only the changes that weren't made are applied.
+    """
+    if limiter is None:
+        limiter = RateLimiter(API_CALL_DELAY)
+
+    if journal is not None and journal.changeset is not None:
+        changeset = journal.remaining()
+        log.info(
+            f"Resuming push to {host} from journal: {len(journal.done)} changes "
+            f"already made, {len(changeset)} left."
+        )
+    else:
+        changeset = plan_push(
+            token,
+            host,
+            blocklist,
+            import_fields,
+            max_followed_severity,
+            scheme,
+            override_private_comment,
+            follow_cache,
+            max_in_flight,
+            mirror,
+            limiter,
+            newest_page,
+        )
+        log.info(
+            f"Planned {len(changeset.adds)} adds and {len(changeset.updates)} "
+            f"updates for {host}, taking about "
+            f"{changeset.estimated_seconds(API_CALL_DELAY):.0f}s."
+        )
+        if plan_file:
+            changeset.save(plan_file, API_CALL_DELAY)
+        if journal is not None and not dryrun and len(changeset):
+            journal.start(changeset)
+
+    def on_written(change: BlockChange, result: dict):
+        if mirror is not None:
+            mirror.record(result)
+        if journal is not None:
+            journal.record(change)
+
+    return execute_changeset(
+        token,
+        host,
+        changeset,
+        dryrun,
+        scheme,
+        max_in_flight,
+        on_written,
+        deadline,
+        limiter,
+    )
+
+
+def plan_push(
+    token: str,
+    host: str,
+    blocklist: list[DomainBlock],
+    import_fields: list = ["domain", "severity"],
+    max_followed_severity: BlockSeverity = BlockSeverity("silence"),
+    scheme: str = "https",
+    override_private_comment: str = None,
+    follow_cache: FollowCache = None,
+    max_in_flight: int = 1,
+    mirror: InstanceMirror = None,
+    limiter: RateLimiter = None,
+    newest_page: list = None,
+) -> Changeset:
+    """Work out every change needed to push a blocklist to an instance
+
+    Fetches the instance's current blocks, and checks for followers of any
+    domain whose block would be more severe than `max_followed_severity`,
+    but doesn't change anything on the instance.
+
+    Follow counts are prefetched by up to `max_in_flight` workers, within the
+    instance's rate limit, while the rest of the blocklist is compared, and
+    are only waited for once every block has been compared.
+
+    If a `mirror` is provided, the instance's blocks are read from it after
+    refreshing it, instead of fetching every page of them.
+
+    Parameters are the same as for push_blocklist.
+    @param limiter: The RateLimiter for API calls to the instance. Stale
+        follow counts are refreshed in the background with it too, so it
+        should be shared with any writes made afterwards.
+    @returns: the Changeset for the instance.
+    """
     # Fetch the existing blocklist from the instance
-    # Force use of the admin API, and add 'id' to the list of fields
+    # Force use of the admin API, and add 'id' to the list of fields.
+    # Copy the list, as other destinations may be using it at the same time.
     if "id" not in import_fields:
-        import_fields.append("id")
-    serverblocks = fetch_instance_blocklist(host, token, True, import_fields, scheme)
+        import_fields = import_fields + ["id"]
+    if mirror is not None:
+        serverblocks = fetch_mirrored_blocklist(
+            host, token, mirror, import_fields, scheme, newest_page
+        )
+    else:
+        serverblocks = fetch_instance_blocklist(
+            host, token, True, import_fields, scheme
+        )
 
-    # # Convert serverblocks to a dictionary keyed by domain name
-    # knownblocks = {row.domain: row for row in serverblocks}
+    changeset = Changeset(host)
+    # Updates only change the fields we imported, keeping the rest as they are
+    update_fields = [field for field in DomainBlock.fields if field in import_fields]
+    if limiter is None:
+        limiter = RateLimiter(API_CALL_DELAY)
+    pool = ThreadPoolExecutor(
+        max_workers=max(1, max_in_flight), thread_name_prefix="follows"
+    )
+    follows = {}
+    # Changes that need a follow count, with the severity they want
+    pending = []
+
+    def prefetch_follows(domain: str):
+        if domain not in follows:
+            follows[domain] = pool.submit(
+                get_instance_follows, token, host, domain, scheme, follow_cache, limiter
+            )
 
-    for newblock in blocklist.values():
+    try:
+        for newblock in blocklist.values():
 
-        log.debug(f"Processing block: {newblock}")
-        if newblock.domain in serverblocks:
-            log.debug(
-                f"Block already exists for {newblock.domain}, "
-                f"checking for differences..."
-            )
+            log.debug(f"Processing block for {host}: {newblock}")
+            if newblock.domain in serverblocks:
+                log.debug(
+                    f"Block already exists for {newblock.domain} at {host}, "
+                    f"checking for differences..."
+                )
 
-            oldblock = serverblocks[newblock.domain]
-
-            change_needed = is_change_needed(oldblock, newblock, import_fields)
-
-            # Is the severity changing?
-            if "severity" in change_needed:
-                log.debug("Severity change requested, checking...")
-                if newblock.severity > oldblock.severity:
-                    # Confirm if we really want to change the severity
-                    # If we still have followers of the remote domain,
-                    # we may not want to go all the way to full suspend,
-                    # depending on the configuration
-                    newseverity = check_followed_severity(
-                        host,
-                        token,
-                        oldblock.domain,
-                        newblock.severity,
-                        max_followed_severity,
-                        scheme,
+                oldblock = serverblocks[newblock.domain]
+
+                change_needed = is_change_needed(oldblock, newblock, import_fields)
+                if not change_needed:
+                    log.debug(
+                        f"No differences detected for {newblock.domain} at {host}. "
+                        f"Not updating."
                     )
-                    if newseverity != oldblock.severity:
-                        newblock.severity = newseverity
-                    else:
-                        log.info(
-                            "Keeping severity of block the same to avoid disrupting followers."  # noqa
-                        )
-                        change_needed.remove("severity")
-
-            if change_needed:
-                log.info(
-                    f"Change detected. Need to update {change_needed} "
-                    f"for domain block for {oldblock.domain}"
-                )
-                log.info(f"Old block definition: {oldblock}")
-                log.info(f"Pushing new block definition: {newblock}")
-                blockdata = oldblock.copy()
-                blockdata.update(newblock)
-                log.debug(f"Block as dict: {blockdata._asdict()}")
+                    changeset.noops.append(newblock.domain)
+                    continue
 
-                if not dryrun:
-                    update_known_block(token, host, blockdata, scheme)
-                    # add a pause here so we don't melt the instance
-                    time.sleep(API_CALL_DELAY)
+                blockdata = oldblock.copy()
+                blockdata.update({field: newblock[field] for field in update_fields})
+                change = BlockChange(blockdata, oldblock.copy(), change_needed)
+
+                # Is the severity changing?
+                # If we still have followers of the remote domain,
+                # we may not want to go all the way to full suspend,
+                # depending on the configuration
+                if (
+                    "severity" in change_needed
+                    and newblock.severity > oldblock.severity
+                    and newblock.severity > max_followed_severity
+                ):
+                    log.debug(
+                        f"Severity increase requested for {newblock.domain} at "
+                        f"{host}, checking follows..."
+                    )
+                    prefetch_follows(newblock.domain)
+                    pending.append(change)
                 else:
-                    log.info("Dry run selected. Not applying changes.")
+                    changeset.updates.append(change)
 
             else:
-                log.debug("No differences detected. Not updating.")
-                pass
-
-        else:
-            # stamp this record with a private comment, since we're the ones adding it
-            if override_private_comment:
-                newblock.private_comment = override_private_comment
-
-            # This is a new block for the target instance, so we
-            # need to add a block rather than update an existing one
-            log.info(f"Adding new block: {newblock}...")
-            log.debug(f"Block as dict: {newblock._asdict()}")
+                # This is a new block for the target instance, so we
+                # need to add a block rather than update an existing one.
+                # Copy it, so the merged blocklist isn't changed.
+                block = newblock.copy()
+
+                # stamp this record with a private comment,
+                # since we're the ones adding it
+                if override_private_comment:
+                    block.private_comment = override_private_comment
+
+                change = BlockChange(block)
+                # Make sure the new block doesn't clobber a domain with followers
+                if block.severity > max_followed_severity:
+                    prefetch_follows(block.domain)
+                    pending.append(change)
+                else:
+                    changeset.adds.append(change)
 
-            # Make sure the new block doesn't clobber a domain with followers
-            newblock.severity = check_followed_severity(
+        # Now the follow counts are needed, limit severities where necessary
+        for change in pending:
+            block = change.block
+            block.severity = limit_followed_severity(
                 host,
-                token,
-                newblock.domain,
-                newblock.severity,
+                block.domain,
+                block.severity,
+                follows[block.domain].result(),
                 max_followed_severity,
-                scheme,
             )
-            if not dryrun:
-                add_block(token, host, newblock, scheme)
-                # add a pause here so we don't melt the instance
-                time.sleep(API_CALL_DELAY)
+            if change.old is None:
+                changeset.adds.append(change)
+            elif block.severity == change.old.severity:
+                log.info(
+                    f"Keeping severity of block for {block.domain} at {host} the "
+                    f"same to avoid disrupting followers."
+                )
+                change.diffs.remove("severity")
+                if change.diffs:
+                    changeset.updates.append(change)
+                else:
+                    change.reason = "severity limited by followers"
+                    changeset.skipped.append(change)
             else:
-                log.info("Dry run selected. Not adding block.")
+                changeset.updates.append(change)
+    finally:
+        pool.shutdown(wait=True)
+
+    # The instance refuses new blocks that aren't stricter than the block of a
+    # parent domain, so don't spend API calls on them
+    rejected = find_rejected_blocks(serverblocks, [c.block for c in changeset.adds])
+    if rejected:
+        adds = []
+        for change in changeset.adds:
+            parent = rejected.get(change.domain)
+            if parent is None:
+                adds.append(change)
+                continue
+            log.info(
+                f"Not adding block for {change.domain} at {host}, "
+                f"as the block for {parent} is at least as strict."
+            )
+            change.reason = f"stricter block exists for parent domain {parent}"
+            changeset.skipped.append(change)
+        changeset.adds = adds
+        log.info(f"Skipping {len(rejected)} new blocks that {host} would refuse.")
+
+    return changeset
+
+
+def execute_changeset(
+    token: str,
+    host: str,
+    changeset: Changeset,
+    dryrun: bool = False,
+    scheme: str = "https",
+    max_in_flight: int = 1,
+    on_written: Callable[[BlockChange, dict], None] = None,
+    deadline: float = None,
+    limiter: RateLimiter = None,
+) -> Counter:
+    """Apply a Changeset to an instance
+
+    Changes are made in order of BlockChange.priority(), so the most
+    protective changes reach the instance first if a push is cut short.
+
+    @param changeset: The changes to make, from plan_push().
+    @param dryrun: If True, only log the changes that would be made.
+    @param max_in_flight: The most API calls to have in flight to the
+        instance at once. Calls still start at most once per API_CALL_DELAY.
+    @param on_written: Called with each change once it's written, and the
+        block the instance returned for it.
+    @param deadline: If provided, the time.monotonic() time after which no
+        more changes are started. Changes left over are counted as 'deferred'.
+    @param limiter: The RateLimiter for API calls to the instance, shared
+        with any other calls being made to it.
+    @returns: a Counter of blocks 'added', 'updated', left 'unchanged',
+        'skipped' and 'deferred'
+    """
+    stats = Counter(
+        added=0,
+        updated=0,
+        unchanged=len(changeset.noops),
+        skipped=len(changeset.skipped),
+        deferred=0,
+    )
+    writes = [(update_known_block, change) for change in changeset.updates]
+    writes.extend((add_block, change) for change in changeset.adds)
+    writes.sort(key=lambda write: write[1].priority())
+
+    for write, change in writes:
+        if write is update_known_block:
+            log.info(
+                f"Change detected. Need to update {change.diffs} "
+                f"for domain block for {change.domain} at {host}"
+            )
+            log.info(f"Old block definition at {host}: {change.old}")
+            log.info(f"Pushing new block definition to {host}: {change.block}")
+            stats["updated"] += 1
+        else:
+            log.info(f"Adding new block at {host}: {change.block}...")
+            stats["added"] += 1
+        log.debug(f"Block for {host} as dict: {change.block._asdict()}")
+
+    if dryrun:
+        log.info(f"Dry run selected. Not applying changes to {host}.")
+    elif writes:
+        deferred = apply_writes(
+            token, host, writes, scheme, max_in_flight, on_written, deadline, limiter
+        )
+        if deferred:
+            log.warning(
+                f"Ran out of time pushing to {host}. "
+                f"Leaving {len(deferred)} changes for the next run."
+            )
+        for write, change in deferred:
+            stats["added" if write is add_block else "updated"] -= 1
+            stats["deferred"] += 1
+
+    return stats
+
+
+def apply_writes(
+    token: str,
+    host: str,
+    writes: list[tuple],
+    scheme: str = "https",
+    max_in_flight: int = 1,
+    on_written: Callable[[BlockChange, dict], None] = None,
+    deadline: float = None,
+    limiter: RateLimiter = None,
+) -> list[tuple]:
+    """Make API writes to an instance, with several in flight at once
+
+    Writes are split between up to `max_in_flight` workers by a hash of the
+    domain, so all the writes for a domain are made by the same worker, in
+    order. A shared RateLimiter spaces the start of every write by
+    API_CALL_DELAY, so the instance's rate limit is respected however many
+    writes are in flight. If a write fails, no more writes are started and
+    the error is raised.
+
+    @param writes: A list of (function, BlockChange) tuples, where function is
+        add_block or update_known_block.
+    @param on_written: Called with each change once it's written, and the
+        block the instance returned for it.
+    @param deadline: If provided, the time.monotonic() time after which no
+        more writes are started.
+    @param limiter: The RateLimiter for API calls to the instance, shared
+        with any other calls being made to it.
+    @returns: the writes that weren't started before the deadline.
+    """
+    if limiter is None:
+        limiter = RateLimiter(API_CALL_DELAY)
+    workers = max(1, min(max_in_flight, len(writes)))
+    shards = [[] for _ in range(workers)]
+    for write, change in writes:
+        shard = zlib.crc32(change.domain.encode("utf-8")) % workers
+        shards[shard].append((write, change))
+
+    failed = threading.Event()
+    deferred = []
+
+    def run_shard(shard: list[tuple]):
+        for i, (write, change) in enumerate(shard):
+            if failed.is_set():
+                return
+            # wait our turn so we don't melt the instance
+            limiter.acquire()
+            if deadline is not None and time.monotonic() >= deadline:
+                deferred.extend(shard[i:])
+                return
+            try:
+                result = write(token, host, change.block, scheme)
+            except Exception:
+                failed.set()
+                raise
+            if on_written is not None:
+                on_written(change, result)
+
+    if workers == 1:
+        run_shard(shards[0])
+        return deferred
+
+    log.debug(f"Writing to {host} with up to {workers} requests in flight...")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="write") as pool:
+        futures = [pool.submit(run_shard, shard) for shard in shards]
+    for future in futures:
+        future.result()
+    return deferred
 
 
 def load_config(configfile: str):
@@ -867,26 +1935,11 @@ def save_domain_block_audit_to_file(blocklist: BlockAuditList, filepath: str):
     @param blocklist: A dictionary of block definitions, keyed by domain
     @param filepath: The path to the file the list should be saved in.
     """
-    export_fields = ["domain", "count", "percent"]
-
-    try:
-        sorted_list = sorted(blocklist.blocks.items())
-    except KeyError:
-        log.error("Field 'domain' not found in blocklist.")
-        log.debug(f"blocklist is: {sorted_list}")
-    except AttributeError:
-        log.error("Attribute error!")
-        import pdb
-
-        pdb.set_trace()
-
     log.debug("exporting audit file")
 
-    with open(filepath, "w") as fp:
-        writer = csv.DictWriter(fp, export_fields, extrasaction="ignore")
-        writer.writeheader()
-        for key, value in sorted_list:
-            writer.writerow(value)
+    with BlockAuditWriter(filepath) as audit:
+        for domain, blockdata in sorted(blocklist.blocks.items()):
+            audit.write(blockdata)
 
 
 def augment_args(args, tomldata: str = None):
@@ -921,9 +1974,37 @@ def augment_args(args, tomldata: str = None):
     if not args.savedir:
         args.savedir = conf.get("savedir", "/tmp")
 
+    if not args.follow_cache_file:
+        args.follow_cache_file = conf.get("follow_cache_file", None)
+    args.follow_cache_ttl = conf.get("follow_cache_ttl", 604800)
+    args.follow_cache_max_stale = conf.get("follow_cache_max_stale", 2592000)
+
+    if not args.instance_mirror_dir:
+        args.instance_mirror_dir = conf.get("instance_mirror_dir", None)
+    args.instance_mirror_max_age = conf.get("instance_mirror_max_age", 86400)
+
+    if not args.push_journal_dir:
+        args.push_journal_dir = conf.get("push_journal_dir", None)
+
+    if not args.push_time_budget:
+        args.push_time_budget = conf.get("push_time_budget", None)
+
+    if not args.push_state_file:
+        args.push_state_file = conf.get("push_state_file", None)
+    args.push_verify_interval = conf.get("push_verify_interval", 86400)
+
+    if not args.push_concurrency:
+        args.push_concurrency = conf.get("push_concurrency", 1)
+
+    if not args.save_push_plan:
+        args.save_push_plan = conf.get("save_push_plan", False)
+
     if not args.blocklist_auditfile:
         args.blocklist_auditfile = conf.get("blocklist_auditfile", None)
 
+    if not args.audit_detail:
+        args.audit_detail = conf.get("audit_detail", False)
+
     if not args.export_fields:
         args.export_fields = conf.get("export_fields", [])
 
@@ -939,6 +2020,15 @@ def augment_args(args, tomldata: str = None):
     if not args.merge_threshold_type:
         args.merge_threshold_type = conf.get("merge_threshold_type", "count")
 
+    if not args.merge_mode:
+        args.merge_mode = conf.get("merge_mode", "standard")
+
+    if not args.allow_subdomains:
+        args.allow_subdomains = conf.get("allow_subdomains", False)
+
+    if not args.collapse_subdomains:
+        args.collapse_subdomains = conf.get("collapse_subdomains", False)
+
     args.blocklist_url_sources = conf.get("blocklist_url_sources", [])
     args.blocklist_instance_sources = resolve_replacements(
         conf.get("blocklist_instance_sources", [])
@@ -994,12 +2084,29 @@ def setup_argparse():
         dest="blocklist_auditfile",
         help="Save blocklist auditfile to this location.",
     )
-    ap.add_argument("--merge-threshold", type=int, help="Merge threshold value")
+    ap.add_argument(
+        "--audit-detail",
+        dest="audit_detail",
+        action="store_true",
+        help="Add merged severity and per-source columns to the auditfile.",
+    )
+    ap.add_argument("--merge-threshold", type=float, help="Merge threshold value")
     ap.add_argument(
         "--merge-threshold-type",
-        choices=["count", "pct"],
+        choices=["count", "pct", "weighted"],
         help="Type of merge threshold to use.",
     )
+    ap.add_argument(
+        "--merge-mode",
+        choices=["standard", "streaming"],
+        help="How to merge blocklists. 'streaming' merges in domain order.",
+    )
+    ap.add_argument(
+        "--collapse-subdomains",
+        dest="collapse_subdomains",
+        action="store_true",
+        help="Remove subdomain blocks already covered by a parent domain block.",
+    )
     ap.add_argument(
         "--override-private-comment",
         dest="override_private_comment",
@@ -1028,6 +2135,20 @@ def setup_argparse():
         default=[],
         help="Override any blocks to allow this domain.",
     )
+    ap.add_argument(
+        "--allow-subdomains",
+        dest="allow_subdomains",
+        action="store_true",
+        help="Also allow subdomains of domains allowed with --allow.",
+    )
+
+    ap.add_argument(
+        "--explain",
+        dest="explain_domains",
+        action="append",
+        default=[],
+        help="Show which blocklists block this domain.",
+    )
 
     ap.add_argument(
         "--no-fetch-url",
@@ -1053,6 +2174,44 @@ def setup_argparse():
         choices=["debug", "info", "warning", "error", "critical"],
         help="Set log output level.",
     )
+    ap.add_argument(
+        "--follow-cache-file",
+        dest="follow_cache_file",
+        help="Cache follow counts for destination instances in this file.",
+    )
+    ap.add_argument(
+        "--instance-mirror-dir",
+        dest="instance_mirror_dir",
+        help="Keep mirrors of destination instance blocklists in this directory.",
+    )
+    ap.add_argument(
+        "--push-journal-dir",
+        dest="push_journal_dir",
+        help="Journal pushes in this directory, so interrupted pushes can resume.",
+    )
+    ap.add_argument(
+        "--push-state-file",
+        dest="push_state_file",
+        help="Skip pushing to instances with nothing new, using state in this file.",
+    )
+    ap.add_argument(
+        "--push-concurrency",
+        dest="push_concurrency",
+        type=int,
+        help="Push to this many destination instances at the same time.",
+    )
+    ap.add_argument(
+        "--push-time-budget",
+        dest="push_time_budget",
+        type=float,
+        help="Stop making changes to an instance after this many seconds.",
+    )
+    ap.add_argument(
+        "--save-push-plan",
+        dest="save_push_plan",
+        action="store_true",
+        help="Save the planned changes for each instance to savedir as JSON.",
+    )
     ap.add_argument(
         "--dryrun",
         action="store_true",
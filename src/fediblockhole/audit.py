@@ -0,0 +1,84 @@
+"""Write the audit file of which blocklists block each domain
+"""
+
+from __future__ import annotations
+
+import csv
+import logging
+import os
+
+from .const import BlockAudit, DomainBlock
+from .tempfiles import mkstemp_beside
+
+log = logging.getLogger("fediblockhole")
+
+
+class BlockAuditWriter(object):
+    """Stream audit records to a file as domains are merged
+
+    Use it as a context manager. Rows are written to a temporary file next to
+    the audit file, which only replaces the audit file once every row has been
+    written, so a failed merge never leaves a partial audit behind.
+
+    If `filepath` is None, nothing is written, so callers can always use a
+    writer whether or not an audit file was asked for.
+
+    @param filepath: The path to save the audit file to, or None.
+    @param origins: The origin of each blocklist being merged.
+    @param detail: If True, also write the merged severity of each domain, and
+        a column per blocklist flagging whether it contributed the domain.
+    """
+
+    def __init__(self, filepath: str = None, origins: list[str] = None, detail=False):
+        self.filepath = filepath
+        self.origins = origins if origins is not None else []
+        self.detail = detail
+        self.rows = 0
+        self._fp = None
+        self._tmppath = None
+        self._writer = None
+
+        self.fields = list(BlockAudit.fields)
+        if detail:
+            self.fields.append("severity")
+            self.fields.extend(self.origins)
+
+    def __enter__(self):
+        if self.filepath:
+            log.info(f"Saving audit file to {self.filepath}")
+            fd, self._tmppath = mkstemp_beside(self.filepath, ".audit-")
+            self._fp = os.fdopen(fd, "w")
+            self._writer = csv.DictWriter(self._fp, self.fields, extrasaction="ignore")
+            self._writer.writeheader()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._fp is None:
+            return
+        self._fp.close()
+        self._fp = None
+        if exc_type is None:
+            os.replace(self._tmppath, self.filepath)
+            log.debug(f"Wrote {self.rows} audit records to {self.filepath}")
+        else:
+            os.unlink(self._tmppath)
+
+    def write(
+        self, blockdata: BlockAudit, membership: int = 0, block: DomainBlock = None
+    ):
+        """Write the audit record for a domain
+
+        @param blockdata: The audit record for the domain.
+        @param membership: A bitset of the indices of blocklists with the domain.
+        @param block: The merged block, or None if the domain wasn't merged.
+        """
+        if self._writer is None:
+            return
+
+        row = blockdata._asdict()
+        if self.detail:
+            row["severity"] = str(block.severity) if block is not None else ""
+            for i, origin in enumerate(self.origins):
+                row[origin] = (membership >> i) & 1
+        self._writer.writerow(row)
+        self.rows += 1
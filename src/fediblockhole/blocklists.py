@@ -4,10 +4,12 @@
 from __future__ import annotations
 
 import csv
+import hashlib
 import json
 import logging
+import sys
 from dataclasses import dataclass, field
-from typing import Iterable
+from typing import Iterable, Iterator
 
 from .const import BlockAudit, BlockSeverity, DomainBlock
 
@@ -19,10 +21,22 @@ class Blocklist:
     """A Blocklist object
 
     A Blocklist is a list of DomainBlocks from an origin
+
+    The weight is how much to trust this Blocklist when using a weighted
+    merge threshold. An allowlist can also allow the subdomains of each of
+    its domains with include_subdomains.
+
+    A merged Blocklist also records the origins of the blocklists it was
+    merged from, and which of them contributed each domain as a bitset of
+    their indices.
     """
 
     origin: str = None
     blocks: dict[str, DomainBlock] = field(default_factory=dict)
+    sources: list[str] = field(default_factory=list)
+    membership: dict[str, int] = field(default_factory=dict)
+    weight: float = 1.0
+    include_subdomains: bool = False
 
     def __len__(self):
         return len(self.blocks)
@@ -42,6 +56,16 @@ class Blocklist:
     def values(self):
         return self.blocks.values()
 
+    def iter_sorted(self) -> Iterator[DomainBlock]:
+        """Iterate over the blocks in domain order"""
+        for domain in sorted(self.blocks):
+            yield self.blocks[domain]
+
+    def sources_for(self, domain: str) -> list[str]:
+        """Which of the merged blocklists contributed a domain"""
+        membership = self.membership.get(domain, 0)
+        return [self.sources[i] for i in iter_bitset(membership)]
+
 
 @dataclass
 class BlockAuditList:
@@ -72,6 +96,108 @@ class BlockAuditList:
         return self.blocks.values()
 
 
+def domain_digest(domain: str) -> str:
+    """The SHA-256 digest of a domain, as published by Mastodon"""
+    return hashlib.sha256(domain.encode("utf-8")).hexdigest()
+
+
+def blocklist_digest(blocks: Iterable[DomainBlock], *settings) -> str:
+    """A stable digest of a set of blocks, whatever order they're in
+
+    @param settings: Any other values to include in the digest, such as the
+        settings the blocks will be pushed with.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for block in sorted(blocks, key=lambda block: block.domain):
+        digest.update(block.digest().encode("ascii"))
+    digest.update(json.dumps([str(value) for value in settings]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def deobfuscate_blocklists(blocklists: list[Blocklist]) -> int:
+    """Work out the real domains of obfuscated blocks, where we can
+
+    Obfuscated domains, like `b*d.example`, can't be merged. If the source
+    published the digest of the real domain, and any blocklist has a plain
+    block for that domain, the obfuscated block is renamed to the plain domain.
+    Blocklists are changed in place.
+
+    @param blocklists: The blocklists to de-obfuscate.
+    @returns: the number of obfuscated domains recovered.
+    """
+    known = {}
+    obfuscated = 0
+    for bl in blocklists:
+        for domain in bl.blocks:
+            if "*" in domain:
+                obfuscated += 1
+            else:
+                known.setdefault(domain_digest(domain), domain)
+
+    if not obfuscated:
+        return 0
+
+    recovered = 0
+    for bl in blocklists:
+        if not any("*" in domain for domain in bl.blocks):
+            continue
+
+        blocks = {}
+        for domain, block in bl.blocks.items():
+            plain = None
+            if "*" in domain and block.domain_digest is not None:
+                plain = known.get(block.domain_digest)
+            if plain is None:
+                blocks.setdefault(domain, block)
+                continue
+
+            log.debug(f"De-obfuscated '{domain}' as '{plain}'.")
+            recovered += 1
+            block.domain = plain
+            # A plain block for the same domain in this list takes precedence
+            if plain not in bl.blocks:
+                blocks.setdefault(plain, block)
+        bl.blocks = blocks
+
+    log.info(f"Recovered {recovered} of {obfuscated} obfuscated domains.")
+    return recovered
+
+
+class InternTable(object):
+    """A run-scoped table of canonical strings
+
+    The same domains and comments turn up in many blocklists. Parsers use an
+    InternTable to share a single copy of each string across every Blocklist
+    parsed during a run, and to keep track of how much memory that saved.
+    Unlike sys.intern(), the table is released when the run is finished.
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.hits = 0
+        self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, value: str) -> str:
+        """Return the canonical copy of a string"""
+        if not isinstance(value, str):
+            return value
+
+        canonical = self.strings.setdefault(value, value)
+        if canonical is not value:
+            self.hits += 1
+            self.bytes_saved += sys.getsizeof(value)
+        return canonical
+
+    def intern_block(self, block: DomainBlock) -> DomainBlock:
+        """Intern the string fields of a DomainBlock in place"""
+        for key in ["domain", "public_comment", "private_comment"]:
+            setattr(block, key, self.intern(getattr(block, key)))
+        return block
+
+
 class BlocklistParser(object):
     """
     Base class for parsing blocklists
@@ -83,14 +209,17 @@ class BlocklistParser(object):
         self,
         import_fields: list = ["domain", "severity"],
         max_severity: str = "suspend",
+        interns: InternTable = None,
     ):
         """Create a Parser
 
         @param import_fields: an optional list of fields to limit the parser to.
             Ignore any fields in a block item that aren't in import_fields.
+        @param interns: an optional InternTable to share strings across parsers.
         """
         self.import_fields = import_fields
         self.max_severity = BlockSeverity(max_severity)
+        self.interns = interns
 
     def preparse(self, blockdata) -> Iterable:
         """Some raw datatypes need to be converted into an iterable"""
@@ -107,6 +236,8 @@ class BlocklistParser(object):
         parsed_list = Blocklist(origin)
         for blockitem in blockdata:
             block = self.parse_item(blockitem)
+            if self.interns is not None:
+                self.interns.intern_block(block)
             parsed_list.blocks[block.domain] = block
         return parsed_list
 
@@ -149,6 +280,9 @@ class BlocklistParserMastodonAPIPublic(BlocklistParserJSON):
     """The public blocklist API is slightly different to the admin one"""
 
     def parse_item(self, blockitem: dict) -> DomainBlock:
+        # Keep the domain digest, so we can work out obfuscated domains later
+        domain_digest = blockitem.pop("digest", None)
+
         # Remove fields we don't want to import
         origitem = blockitem.copy()
         for key in origitem:
@@ -166,6 +300,7 @@ class BlocklistParserMastodonAPIPublic(BlocklistParserJSON):
         block = DomainBlock(**blockitem)
         if block.severity > self.max_severity:
             block.severity = self.max_severity
+        block.domain_digest = domain_digest
         return block
 
 
@@ -273,6 +408,16 @@ class RapidBlockParserJSON(BlocklistParserJSON):
         return block
 
 
+def iter_bitset(bitset: int) -> Iterator[int]:
+    """Iterate over the indices of the bits that are set in a bitset"""
+    index = 0
+    while bitset:
+        if bitset & 1:
+            yield index
+        bitset >>= 1
+        index += 1
+
+
 def str2bool(boolstring: str) -> bool:
     """Helper function to convert boolean strings to actual Python bools"""
     boolstring = boolstring.lower()
@@ -301,9 +446,10 @@ def parse_blocklist(
     format="csv",
     import_fields: list = ["domain", "severity"],
     max_severity: str = "suspend",
+    interns: InternTable = None,
 ):
     """Parse a blocklist in the given format"""
     log.debug(f"parsing {format} blocklist with import_fields: {import_fields}...")
 
-    parser = FORMAT_PARSERS[format](import_fields, max_severity)
+    parser = FORMAT_PARSERS[format](import_fields, max_severity, interns)
     return parser.parse_blocklist(blockdata, origin)
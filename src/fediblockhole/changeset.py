@@ -0,0 +1,146 @@
+"""The planned changes to push a blocklist to an instance
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass, field
+
+from .const import DomainBlock, SeverityLevel
+
+log = logging.getLogger("fediblockhole")
+
+
+@dataclass
+class BlockChange:
+    """A single planned change to an instance's domain blocks
+
+    @param block: The block to push. For an update, this is the block
+        already on the instance, with the new values applied.
+    @param old: The block already on the instance, if there is one.
+    @param diffs: The fields that will change, for an update.
+    @param reason: Why a change is being skipped.
+    """
+
+    block: DomainBlock
+    old: DomainBlock = None
+    diffs: list[str] = field(default_factory=list)
+    reason: str = ""
+
+    @property
+    def domain(self) -> str:
+        return self.block.domain
+
+    def priority(self) -> tuple:
+        """How soon to make this change, lowest first
+
+        The most protective changes come first: new suspensions, then other
+        new blocks and severity increases, then every other update, such as a
+        change of flags or comments. Within each group, more severe blocks
+        come first.
+        """
+        if self.old is None:
+            group = 0 if self.block.severity.level == SeverityLevel.SUSPEND else 1
+        elif "severity" in self.diffs and self.block.severity > self.old.severity:
+            group = 1
+        else:
+            group = 2
+        return (group, -self.block.severity.level)
+
+    def _asdict(self) -> dict:
+        """Return a dict version of this change, for saving as JSON"""
+        dictval = {"domain": self.domain, "block": self.block._asdict()}
+        if self.old is not None:
+            old = self.old._asdict()
+            new = self.block._asdict()
+            dictval["diffs"] = {key: [old.get(key), new.get(key)] for key in self.diffs}
+        if self.reason:
+            dictval["reason"] = self.reason
+        return dictval
+
+    @classmethod
+    def from_dict(cls, dictval: dict) -> BlockChange:
+        """Make a BlockChange from the dict version saved by _asdict()"""
+        block = DomainBlock(**dictval["block"])
+        old = None
+        if "diffs" in dictval:
+            old = block.copy()
+            old.update({key: values[0] for key, values in dictval["diffs"].items()})
+        diffs = list(dictval.get("diffs", []))
+        return cls(block, old, diffs, dictval.get("reason", ""))
+
+
+@dataclass
+class Changeset:
+    """Every change needed to push a blocklist to an instance
+
+    A Changeset is worked out in full before any changes are made, so the
+    size of a push is known before it starts.
+
+    @param host: The instance the changes are for.
+    @param adds: New blocks to add.
+    @param updates: Existing blocks to update.
+    @param noops: Domains that are already blocked as they should be.
+    @param skipped: Changes we've decided not to make, with the reason why.
+    """
+
+    host: str
+    adds: list[BlockChange] = field(default_factory=list)
+    updates: list[BlockChange] = field(default_factory=list)
+    noops: list[str] = field(default_factory=list)
+    skipped: list[BlockChange] = field(default_factory=list)
+
+    def __len__(self):
+        """The number of changes to make"""
+        return len(self.adds) + len(self.updates)
+
+    def api_calls(self) -> int:
+        """How many write API calls it will take to apply the changeset"""
+        return len(self.adds) + len(self.updates)
+
+    def estimated_seconds(self, api_call_delay: float) -> float:
+        """How long it will take to apply the changeset at a given rate limit
+
+        @param api_call_delay: The number of seconds between API calls.
+        """
+        return self.api_calls() * api_call_delay
+
+    def _asdict(self, api_call_delay: float = 0) -> dict:
+        """Return a dict version of the changeset, for saving as JSON"""
+        return {
+            "host": self.host,
+            "estimate": {
+                "api_calls": self.api_calls(),
+                "seconds": self.estimated_seconds(api_call_delay),
+            },
+            "adds": [change._asdict() for change in self.adds],
+            "updates": [change._asdict() for change in self.updates],
+            "noops": self.noops,
+            "skipped": [change._asdict() for change in self.skipped],
+        }
+
+    @classmethod
+    def from_dict(cls, dictval: dict) -> Changeset:
+        """Make a Changeset from the dict version saved by _asdict()"""
+        return cls(
+            dictval["host"],
+            [BlockChange.from_dict(change) for change in dictval["adds"]],
+            [BlockChange.from_dict(change) for change in dictval["updates"]],
+            list(dictval["noops"]),
+            [BlockChange.from_dict(change) for change in dictval["skipped"]],
+        )
+
+    def to_json(self, api_call_delay: float = 0, **kwargs) -> str:
+        """Serialize the changeset to JSON
+
+        @param api_call_delay: The number of seconds between API calls,
+            used to estimate how long the changeset will take to apply.
+        """
+        return json.dumps(self._asdict(api_call_delay), **kwargs)
+
+    def save(self, filepath: str, api_call_delay: float = 0):
+        """Save the changeset to a JSON file"""
+        log.info(f"Saving push plan for {self.host} to {filepath}")
+        with open(filepath, "w") as fp:
+            fp.write(self.to_json(api_call_delay, indent=2))
@@ -4,6 +4,8 @@
 from __future__ import annotations
 
 import enum
+import hashlib
+import json
 import logging
 
 log = logging.getLogger("fediblockhole")
@@ -93,15 +95,27 @@ class BlockAudit(object):
         "domain",
         "count",
         "percent",
+        "score",
+        "sources",
     ]
 
-    all_fields = ["domain", "count", "percent", "id"]
+    all_fields = ["domain", "count", "percent", "score", "sources", "id"]
 
-    def __init__(self, domain: str, count: int = 0, percent: int = 0, id: int = None):
+    def __init__(
+        self,
+        domain: str,
+        count: int = 0,
+        percent: int = 0,
+        score: float = 0,
+        sources: str = "",
+        id: int = None,
+    ):
         """Initialize the BlockAudit"""
         self.domain = domain
         self.count = count
         self.percent = percent
+        self.score = score
+        self.sources = sources
         self.id = id
 
     def _asdict(self):
@@ -110,6 +124,8 @@ class BlockAudit(object):
             "domain": self.domain,
             "count": self.count,
             "percent": self.percent,
+            "score": self.score,
+            "sources": self.sources,
         }
         if self.id:
             dictval["id"] = self.id
@@ -132,7 +148,7 @@ class BlockAudit(object):
 
     def __iter__(self):
         """Be iterable"""
-        keys = self.fields
+        keys = list(self.fields)
 
         if getattr(self, "id", False):
             keys.append("id")
@@ -184,6 +200,10 @@ class DomainBlock(object):
         "id",
     ]
 
+    # The SHA-256 digest of the domain, if a source published one.
+    # Mastodon publishes it alongside obfuscated domains in its public API.
+    domain_digest = None
+
     def __init__(
         self,
         domain: str,
@@ -232,6 +252,15 @@ class DomainBlock(object):
 
         return dictval
 
+    def digest(self) -> str:
+        """A stable digest of the block's values
+
+        The digest is the same in every Python process, so it can be saved
+        and compared with blocks seen in a later run.
+        """
+        data = json.dumps(self._asdict(), sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
     def compare_fields(self, other, fields=None) -> list:
         """Compare two DomainBlocks on specific fields.
         If all the fields are equal, the DomainBlocks are equal.
@@ -246,7 +275,7 @@ class DomainBlock(object):
 
         diffs = []
         # Check if all the fields are equal
-        for field in self.fields:
+        for field in fields:
             if getattr(self, field) != getattr(other, field):
                 diffs.append(field)
         return diffs
@@ -272,7 +301,7 @@ class DomainBlock(object):
 
     def __iter__(self):
         """Be iterable"""
-        keys = self.fields
+        keys = list(self.fields)
 
         if getattr(self, "id", False):
             keys.append("id")
@@ -0,0 +1,198 @@
+"""A trie of domain names, for finding blocks of parent domains
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Iterable, Iterator
+
+from .blocklists import Blocklist
+from .const import DomainBlock, SeverityLevel
+
+log = logging.getLogger("fediblockhole")
+
+
+class DomainTrie(object):
+    """A trie of domain names, keyed by their labels in reverse order
+
+    `a.bad.example` is stored under `example` -> `bad` -> `a`, so all the
+    parent domains of a domain are found by walking down from the root.
+    """
+
+    def __init__(self):
+        # Each node is a tuple of a dict of child nodes keyed by label,
+        # and a single-item list holding the node's value, if it has one.
+        self._root = ({}, [])
+        self._len = 0
+
+    @staticmethod
+    def labels(domain: str) -> list[str]:
+        """Split a domain into its labels, from the top level down"""
+        return domain.strip(".").lower().split(".")[::-1]
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, domain: str):
+        node = self._find(domain)
+        return node is not None and len(node[1]) > 0
+
+    def _find(self, domain: str):
+        node = self._root
+        for label in self.labels(domain):
+            node = node[0].get(label)
+            if node is None:
+                return None
+        return node
+
+    def insert(self, domain: str, value=None):
+        """Add a domain to the trie, replacing any value it already has"""
+        node = self._root
+        for label in self.labels(domain):
+            node = node[0].setdefault(label, ({}, []))
+        if node[1]:
+            node[1][0] = value
+        else:
+            node[1].append(value)
+            self._len += 1
+
+    def get(self, domain: str, default=None):
+        node = self._find(domain)
+        if node is None or not node[1]:
+            return default
+        return node[1][0]
+
+    def parents(self, domain: str) -> Iterator[tuple[str, object]]:
+        """Iterate over the parent domains of a domain that are in the trie
+
+        The domain itself isn't included. The closest parents come last.
+
+        @returns: an iterator of (parent domain, value) tuples
+        """
+        labels = self.labels(domain)
+        node = self._root
+        for depth, label in enumerate(labels[:-1]):
+            node = node[0].get(label)
+            if node is None:
+                return
+            if node[1]:
+                yield ".".join(reversed(labels[: depth + 1])), node[1][0]
+
+
+def covers(parent: DomainBlock, child: DomainBlock) -> bool:
+    """Does a block of a parent domain already cover a block of a subdomain?
+
+    A suspended parent covers any subdomain block. Otherwise, the parent
+    must be at least as severe, and reject media and reports if the
+    subdomain block does.
+    """
+    if parent.severity.level == SeverityLevel.SUSPEND:
+        return True
+    if parent.severity.level < child.severity.level:
+        return False
+    if child.reject_media and not parent.reject_media:
+        return False
+    if child.reject_reports and not parent.reject_reports:
+        return False
+    return True
+
+
+def stricter_than(block: DomainBlock, other: DomainBlock) -> bool:
+    """Would Mastodon accept a block as stricter than a parent domain's block?
+
+    This is Mastodon's own rule for adding a block of a subdomain. A
+    suspension is always stricter. Otherwise, the block must be at least as
+    severe, and reject media and reports if the parent's block does.
+    """
+    if block.severity.level == SeverityLevel.SUSPEND:
+        return True
+    if block.severity.level < other.severity.level:
+        return False
+    if other.reject_media and not block.reject_media:
+        return False
+    if other.reject_reports and not block.reject_reports:
+        return False
+    return True
+
+
+def find_rejected_blocks(
+    existing: Blocklist, blocks: Iterable[DomainBlock]
+) -> dict[str, str]:
+    """Find new blocks that an instance would refuse to add
+
+    Mastodon compares a new block with the block of its closest parent
+    domain, and refuses it unless the new block is stricter.
+
+    @param existing: The blocks already on the instance.
+    @param blocks: The new blocks to check.
+    @returns: a dict of each refused domain and the parent domain whose
+        block is at least as strict.
+    """
+    trie = DomainTrie()
+    for domain, block in existing.items():
+        trie.insert(domain, block)
+
+    rejected = {}
+    if not len(trie):
+        return rejected
+    for block in blocks:
+        parents = list(trie.parents(block.domain))
+        if not parents:
+            continue
+        # Only the closest parent's block counts
+        parent, parentblock = parents[-1]
+        if not stricter_than(block, parentblock):
+            rejected[block.domain] = parent
+    return rejected
+
+
+def find_redundant_subdomains(blocklist: Blocklist) -> dict[str, str]:
+    """Find blocks of subdomains that a parent domain block already covers
+
+    @param blocklist: The blocklist to check.
+    @returns: a dict of each redundant subdomain and the parent domain
+        that covers it, in blocklist order.
+    """
+    trie = DomainTrie()
+    for domain, block in blocklist.items():
+        trie.insert(domain, block)
+
+    redundant = {}
+    for domain, block in blocklist.items():
+        for parent, parentblock in trie.parents(domain):
+            if covers(parentblock, block):
+                redundant[domain] = parent
+                break
+    return redundant
+
+
+def collapse_subdomains(blocklist: Blocklist, remove: bool = True) -> dict[str, str]:
+    """Find, and optionally remove, redundant subdomain blocks
+
+    A block for a subdomain is redundant if a block for a parent domain is at
+    least as strict, so pushing them only wastes API calls.
+
+    @param blocklist: The merged blocklist to collapse.
+    @param remove: If True, remove redundant blocks from the blocklist.
+        Otherwise, only report them.
+    @returns: a dict of each redundant subdomain and the parent domain
+        that covers it.
+    """
+    redundant = find_redundant_subdomains(blocklist)
+    for domain, parent in redundant.items():
+        log.debug(f"Block for '{domain}' is covered by block for '{parent}'.")
+        if remove:
+            del blocklist.blocks[domain]
+
+    if redundant:
+        if remove:
+            log.info(
+                f"Removed {len(redundant)} subdomain blocks "
+                f"covered by a parent domain block."
+            )
+        else:
+            log.info(
+                f"Found {len(redundant)} subdomain blocks "
+                f"covered by a parent domain block."
+            )
+    return redundant
@@ -0,0 +1,170 @@
+"""An on-disk cache of how many followers instances have on remote domains
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from .tempfiles import mkstemp_beside
+
+log = logging.getLogger("fediblockhole")
+
+
+class FollowCache(object):
+    """Follow counts for (instance, domain) pairs, saved between runs
+
+    A cached count is fresh for `ttl` seconds, and is used without asking
+    the instance again. For `max_stale` seconds after that, the stale count is
+    still used, but it is refreshed in the background for the next run.
+    Counts older than that are fetched again before they are used.
+
+    Background refreshes for each instance take turns, one at a time, so they
+    don't hold up refreshes for other instances. Refreshes that haven't started
+    by the time the cache is closed are left for a later run.
+
+    @param filepath: Where the cache is saved.
+    @param ttl: How many seconds a follow count stays fresh.
+    @param max_stale: How many seconds after `ttl` a stale count can be used.
+    @param entries: Cached [count, fetched_at] pairs, keyed by host and domain.
+    """
+
+    version = 1
+
+    def __init__(
+        self,
+        filepath: str = None,
+        ttl: float = 604800,
+        max_stale: float = 2592000,
+        entries: dict = None,
+    ):
+        self.filepath = filepath
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.entries = entries if entries is not None else {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._executors = {}
+        self._futures = []
+
+    @classmethod
+    def load(cls, filepath: str, ttl: float = 604800, max_stale: float = 2592000):
+        """Load a saved follow cache, or start an empty one"""
+        try:
+            with open(filepath) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return cls(filepath, ttl, max_stale)
+        except ValueError as e:
+            log.warning(f"Ignoring unreadable follow cache at {filepath}: {e}")
+            return cls(filepath, ttl, max_stale)
+
+        if data.get("version") != cls.version:
+            log.warning(f"Ignoring follow cache version {data.get('version')}.")
+            return cls(filepath, ttl, max_stale)
+
+        return cls(filepath, ttl, max_stale, data["entries"])
+
+    def get(self, host: str, domain: str) -> tuple[int, bool]:
+        """Get a cached follow count
+
+        @returns: a tuple of the follow count, or None if there isn't a usable
+            one, and whether the count is still fresh.
+        """
+        with self._lock:
+            entry = self.entries.get(host, {}).get(domain)
+            if entry is not None:
+                follows, fetched_at = entry
+                age = time.time() - fetched_at
+                if age < self.ttl + self.max_stale:
+                    self.hits += 1
+                    return follows, age < self.ttl
+            self.misses += 1
+            return None, False
+
+    def set(self, host: str, domain: str, follows: int):
+        """Cache a follow count we've just fetched"""
+        with self._lock:
+            self.entries.setdefault(host, {})[domain] = [follows, time.time()]
+
+    def revalidate(self, host: str, domain: str, fetch: Callable[[], int]):
+        """Refresh a stale follow count in the background
+
+        @param fetch: Fetches the current follow count from the instance.
+        """
+
+        def refresh():
+            try:
+                follows = fetch()
+            except Exception as e:
+                log.warning(f"Failed to refresh follows for {domain} at {host}: {e}")
+                return
+            self.set(host, domain, follows)
+            with self._lock:
+                self.refreshed += 1
+
+        with self._lock:
+            if (host, domain) in self._revalidating:
+                return
+            self._revalidating.add((host, domain))
+            executor = self._executors.get(host)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"followcache-{host}"
+                )
+                self._executors[host] = executor
+            self._futures.append(executor.submit(refresh))
+
+    def close(self):
+        """Drop background refreshes that haven't started, then save the cache
+
+        Only refreshes already in flight are waited for, so a run doesn't
+        wait for every stale count to be fetched. Stale counts that weren't
+        refreshed are still usable, and are refreshed on a later run.
+        """
+        with self._lock:
+            dropped = sum(future.cancel() for future in self._futures)
+            executors = list(self._executors.values())
+            self._executors = {}
+            self._futures = []
+        for executor in executors:
+            executor.shutdown(wait=True)
+        log.info(
+            f"Follow cache: {self.hits} hits, {self.misses} misses, "
+            f"{self.refreshed} refreshed in the background, "
+            f"{dropped} left for a later run."
+        )
+        if self.filepath:
+            self.save()
+
+    def save(self):
+        """Save the cache, dropping any counts too old to use again
+
+        The cache is written to a temporary file first, so an interrupted
+        save never leaves a partial cache behind.
+        """
+        oldest = time.time() - self.ttl - self.max_stale
+        with self._lock:
+            entries = {}
+            for host, domains in self.entries.items():
+                kept = {d: e for d, e in domains.items() if e[1] >= oldest}
+                if kept:
+                    entries[host] = kept
+
+        data = {"version": self.version, "entries": entries}
+        fd, tmppath = mkstemp_beside(self.filepath, ".followcache-")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(data, fp)
+            os.replace(tmppath, self.filepath)
+        except BaseException:
+            os.unlink(tmppath)
+            raise
@@ -0,0 +1,148 @@
+"""A journal of the changes being pushed to an instance, so a push can resume
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+
+from .changeset import BlockChange, Changeset
+from .tempfiles import mkstemp_beside
+
+log = logging.getLogger("fediblockhole")
+
+
+class PushJournal(object):
+    """A write-ahead journal of a push to an instance
+
+    The planned Changeset is written to the journal before any change is made,
+    then a line is appended as each change is applied. If the push is
+    interrupted, the next run reads the journal and applies only the changes
+    that are left, without planning the push again.
+
+    A journal is only resumed if it was planned from the same blocklist and
+    settings, which are identified by `key`.
+
+    @param filepath: Where the journal is kept.
+    @param host: The instance being pushed to.
+    @param key: A digest of the blocklist and settings being pushed.
+    @param changeset: The planned changes, if a push was already started.
+    @param done: The domains whose changes have been applied.
+    """
+
+    version = 1
+
+    def __init__(
+        self,
+        filepath: str,
+        host: str,
+        key: str,
+        changeset: Changeset = None,
+        done: set = None,
+    ):
+        self.filepath = filepath
+        self.host = host
+        self.key = key
+        self.changeset = changeset
+        self.done = done if done is not None else set()
+        self._fp = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filepath: str, host: str, key: str) -> PushJournal:
+        """Load an unfinished push from a journal, or start an empty journal
+
+        A line only partly written when a run was interrupted is ignored.
+        """
+        try:
+            with open(filepath) as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            return cls(filepath, host, key)
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError) as e:
+            log.warning(f"Ignoring unreadable push journal at {filepath}: {e}")
+            return cls(filepath, host, key)
+
+        if (
+            header.get("version") != cls.version
+            or header.get("host") != host
+            or header.get("key") != key
+        ):
+            log.info(f"Push journal at {filepath} is for a different push. Ignoring.")
+            return cls(filepath, host, key)
+
+        done = set()
+        for line in lines[1:]:
+            try:
+                done.add(json.loads(line)["done"])
+            except (ValueError, KeyError):
+                break
+        changeset = Changeset.from_dict(header["changeset"])
+        return cls(filepath, host, key, changeset, done)
+
+    def remaining(self) -> Changeset:
+        """The planned changes that haven't been applied yet"""
+        return Changeset(
+            self.changeset.host,
+            [c for c in self.changeset.adds if c.domain not in self.done],
+            [c for c in self.changeset.updates if c.domain not in self.done],
+            self.changeset.noops,
+            self.changeset.skipped,
+        )
+
+    def start(self, changeset: Changeset):
+        """Write the planned changes to a new journal, before applying any
+
+        The journal is written to a temporary file first, so an interrupted
+        start never leaves a partial plan behind.
+        """
+        self.changeset = changeset
+        self.done = set()
+        header = {
+            "version": self.version,
+            "host": self.host,
+            "key": self.key,
+            "changeset": changeset._asdict(),
+        }
+        fd, tmppath = mkstemp_beside(self.filepath, ".journal-")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(json.dumps(header) + "\n")
+            os.replace(tmppath, self.filepath)
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+        self._fp = open(self.filepath, "a")
+
+    def record(self, change: BlockChange):
+        """Record that a change has been applied
+
+        Each line is flushed to disk before the next change is made.
+        """
+        with self._lock:
+            self.done.add(change.domain)
+            if self._fp is None:
+                self._fp = open(self.filepath, "a")
+            self._fp.write(json.dumps({"done": change.domain}) + "\n")
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+
+    def close(self):
+        """Close the journal, leaving it to resume from next time"""
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    def discard(self):
+        """Remove the journal, once every change has been applied"""
+        self.close()
+        try:
+            os.unlink(self.filepath)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,142 @@
+"""A local mirror of a destination instance's admin domain blocks
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+
+from .tempfiles import mkstemp_beside
+
+log = logging.getLogger("fediblockhole")
+
+
+class InstanceMirror(object):
+    """The admin domain blocks of an instance, as we last saw them
+
+    Blocks are kept as the dicts returned by the admin API, keyed by their id.
+    The mirror is kept up to date by fetching blocks newer than the newest
+    one we know about, and by recording the blocks we add or update.
+
+    Changes to older blocks made by someone else can't be seen that way, so
+    the whole mirror is fetched again once it's `max_age` seconds old.
+
+    @param host: The instance being mirrored.
+    @param blocks: The instance's domain blocks, keyed by id.
+    @param max_age: How many seconds to trust the mirror for.
+    @param refreshed_at: When every block was last fetched.
+    """
+
+    version = 2
+
+    def __init__(
+        self,
+        host: str,
+        blocks: dict = None,
+        max_age: float = 86400,
+        refreshed_at: float = 0,
+    ):
+        self.host = host
+        self.blocks = blocks if blocks is not None else {}
+        self.max_age = max_age
+        self.refreshed_at = refreshed_at
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filepath: str, host: str, max_age: float = 86400) -> InstanceMirror:
+        """Load a saved mirror, or start an empty one"""
+        try:
+            with open(filepath) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return cls(host, max_age=max_age)
+        except ValueError as e:
+            log.warning(f"Ignoring unreadable mirror of {host} at {filepath}: {e}")
+            return cls(host, max_age=max_age)
+
+        if data.get("version") != cls.version or data.get("host") != host:
+            log.warning(f"Ignoring mismatched mirror of {host} at {filepath}.")
+            return cls(host, max_age=max_age)
+
+        return cls(host, data["blocks"], max_age, data["refreshed_at"])
+
+    def save(self, filepath: str):
+        """Save the mirror
+
+        The mirror is written to a temporary file first, so an interrupted
+        save never leaves a partial mirror behind.
+        """
+        with self._lock:
+            data = {
+                "version": self.version,
+                "host": self.host,
+                "refreshed_at": self.refreshed_at,
+                "blocks": self.blocks,
+            }
+            fd, tmppath = mkstemp_beside(filepath, ".mirror-")
+            try:
+                with os.fdopen(fd, "w") as fp:
+                    json.dump(data, fp)
+                os.replace(tmppath, filepath)
+            except BaseException:
+                os.unlink(tmppath)
+                raise
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def is_stale(self) -> bool:
+        """Is it time to fetch every block again?"""
+        return time.time() - self.refreshed_at >= self.max_age
+
+    def max_id(self) -> int:
+        """The id of the newest block, or None if the mirror is empty"""
+        with self._lock:
+            return max((int(id) for id in self.blocks), default=None)
+
+    def blockdata(self, limit: int = None) -> list[dict]:
+        """Copies of the blocks, newest first, in the same order as the admin API
+
+        Copies are returned because the blocklist parsers remove the fields
+        they don't import from the dicts they're given.
+
+        @param limit: Only return this many of the newest blocks.
+        """
+        with self._lock:
+            ids = sorted(self.blocks, key=int, reverse=True)
+            return [dict(self.blocks[id]) for id in ids[:limit]]
+
+    def replace(self, items: list[dict]):
+        """Replace every block in the mirror, after fetching all of them"""
+        with self._lock:
+            self.blocks = {str(item["id"]): item for item in items}
+            self.refreshed_at = time.time()
+
+    def update(self, items: list[dict]):
+        """Add or update blocks in the mirror"""
+        with self._lock:
+            for item in items:
+                self.blocks[str(item["id"])] = item
+
+    def record(self, item: dict):
+        """Record a block we've just written to the instance
+
+        @param item: The block as returned by the admin API, or None if the
+            write didn't return a block.
+        """
+        if item is not None:
+            self.update([item])
+
+    def matches(self, page: list[dict], limit: int) -> bool:
+        """Check the newest page of blocks from the instance against the mirror
+
+        @param page: The newest page of blocks, as returned by the admin API.
+        @param limit: The page size that was asked for. A page with fewer
+            blocks than this is every block on the instance.
+        """
+        if len(page) < limit and len(page) != len(self):
+            return False
+        return self.blockdata(len(page)) == page
@@ -0,0 +1,113 @@
+"""Persisted state of previous pushes, used to skip pushes with nothing to do
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+
+from .tempfiles import mkstemp_beside
+
+log = logging.getLogger("fediblockhole")
+
+
+class PushState(object):
+    """What was last pushed to each destination instance
+
+    For each instance, we keep a digest of the blocklist and settings that
+    were pushed, a digest of the instance's newest page of blocks just after
+    the push, and when the push finished. If neither digest has changed by the
+    next run, there's nothing to push. To catch changes the newest page
+    doesn't show, such as an old block being removed, a full push is still
+    done once `max_age` seconds have passed since the last one.
+
+    @param filepath: Where the state is saved.
+    @param max_age: How many seconds to trust the state of an instance for.
+    @param destinations: The saved state of each instance, keyed by host.
+    """
+
+    version = 1
+
+    def __init__(self, filepath: str, max_age: float = 86400, destinations=None):
+        self.filepath = filepath
+        self.max_age = max_age
+        self.destinations = destinations if destinations is not None else {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filepath: str, max_age: float = 86400) -> PushState:
+        """Load a saved push state, or start an empty one"""
+        try:
+            with open(filepath) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return cls(filepath, max_age)
+        except ValueError as e:
+            log.warning(f"Ignoring unreadable push state at {filepath}: {e}")
+            return cls(filepath, max_age)
+
+        if data.get("version") != cls.version:
+            log.warning(f"Ignoring push state version {data.get('version')}.")
+            return cls(filepath, max_age)
+
+        return cls(filepath, max_age, data["destinations"])
+
+    def current(self, host: str) -> bool:
+        """Check whether there's a recent enough push to an instance to trust
+
+        If not, the instance needs a full push, whatever has changed.
+        """
+        with self._lock:
+            state = self.destinations.get(host)
+        if state is None:
+            return False
+        if time.time() - state["pushed_at"] >= self.max_age:
+            log.info(f"Last full push to {host} is too old. Pushing again.")
+            return False
+        return True
+
+    def unchanged(self, host: str, digest: str, probe: str) -> bool:
+        """Check whether there's nothing new to push to an instance
+
+        @param digest: A digest of the blocklist and settings to push.
+        @param probe: A digest of the instance's newest page of blocks.
+        """
+        if not self.current(host):
+            return False
+        with self._lock:
+            state = self.destinations[host]
+        return state["digest"] == digest and state["probe"] == probe
+
+    def record(self, host: str, digest: str, probe: str):
+        """Record a complete push to an instance"""
+        with self._lock:
+            self.destinations[host] = {
+                "digest": digest,
+                "probe": probe,
+                "pushed_at": time.time(),
+            }
+
+    def forget(self, host: str):
+        """Forget an instance, so the next run pushes to it in full"""
+        with self._lock:
+            self.destinations.pop(host, None)
+
+    def save(self):
+        """Save the push state
+
+        The state is written to a temporary file first, so an interrupted
+        save never leaves a partial state behind.
+        """
+        with self._lock:
+            data = {"version": self.version, "destinations": self.destinations}
+            fd, tmppath = mkstemp_beside(self.filepath, ".pushstate-")
+            try:
+                with os.fdopen(fd, "w") as fp:
+                    json.dump(data, fp)
+                os.replace(tmppath, self.filepath)
+            except BaseException:
+                os.unlink(tmppath)
+                raise
@@ -0,0 +1,34 @@
+"""Keep API calls to an instance under its rate limit
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Space out API calls to a host, across any number of threads
+
+    Each call to acquire() reserves the next free slot, `interval` seconds
+    after the previous one, and waits until it arrives. Slots are spaced from
+    when calls start, not when they finish, so several calls can be in flight
+    at once without going over the rate limit.
+
+    @param interval: The number of seconds between the start of each call.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until the next call is allowed"""
+        with self._lock:
+            now = time.monotonic()
+            slot = now if self._next is None else max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
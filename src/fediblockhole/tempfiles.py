@@ -0,0 +1,33 @@
+"""Temporary files for replacing other files without leaving partial copies
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+
+# Reading the umask means setting it, so it's only done once, at import
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def mkstemp_beside(filepath: str, prefix: str) -> tuple[int, str]:
+    """Make a temporary file in the same directory as a file it will replace
+
+    mkstemp() makes files only their owner can read, and os.replace() keeps
+    that mode, so the temporary file is given the mode a new file would get
+    from the umask instead.
+
+    @param filepath: The file the temporary file will replace.
+    @param prefix: The prefix for the temporary file's name.
+    @returns: a tuple of the open file descriptor and the temporary file's path.
+    """
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    fd, tmppath = tempfile.mkstemp(dir=dirname, prefix=prefix)
+    try:
+        os.fchmod(fd, 0o666 & ~UMASK)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmppath)
+        raise
+    return fd, tmppath
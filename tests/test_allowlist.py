@@ -89,3 +89,69 @@ def test_allowlist_removes_tld():
 
     with pytest.raises(KeyError):
         merged[".tk"]
+
+
+def test_allowlist_exact_by_default():
+    """Subdomains of an allowed domain stay blocked by default"""
+    conf = shim_argparse(["-A", "example.org"])
+
+    merged = Blocklist(
+        "test_allowlist.merged",
+        {
+            "example.org": DomainBlock("example.org"),
+            "media.example.org": DomainBlock("media.example.org"),
+        },
+    )
+
+    merged = apply_allowlists(merged, conf, [])
+
+    assert list(merged) == ["media.example.org"]
+
+
+def test_allowlist_include_subdomains():
+    """An allowlist can allow the subdomains of its domains"""
+    conf = shim_argparse()
+
+    merged = Blocklist(
+        "test_allowlist.merged",
+        {
+            "example.org": DomainBlock("example.org"),
+            "media.example.org": DomainBlock("media.example.org"),
+            "a.b.example.org": DomainBlock("a.b.example.org"),
+            "notexample.org": DomainBlock("notexample.org"),
+            "removeme.org": DomainBlock("removeme.org"),
+            "sub.removeme.org": DomainBlock("sub.removeme.org"),
+        },
+    )
+
+    allowlists = [
+        Blocklist(
+            "test_allowlist.list1",
+            {"example.org": DomainBlock("example.org", "noop")},
+            include_subdomains=True,
+        ),
+        Blocklist(
+            "test_allowlist.list2",
+            {"removeme.org": DomainBlock("removeme.org", "noop")},
+        ),
+    ]
+
+    merged = apply_allowlists(merged, conf, allowlists)
+
+    assert list(merged) == ["notexample.org", "sub.removeme.org"]
+
+
+def test_cmdline_allow_subdomains():
+    conf = shim_argparse(["-A", "example.org", "--allow-subdomains"])
+
+    merged = Blocklist(
+        "test_allowlist.merged",
+        {
+            "media.example.org": DomainBlock("media.example.org"),
+            "keepblockingme.org": DomainBlock("keepblockingme.org"),
+        },
+    )
+
+    merged = apply_allowlists(merged, conf, [])
+
+    assert list(merged) == ["keepblockingme.org"]
@@ -0,0 +1,99 @@
+"""Test writing the audit file
+"""
+
+import os
+import stat
+
+import pytest
+
+import fediblockhole.tempfiles
+from fediblockhole import merge_blocklists, merge_blocklists_streaming
+from fediblockhole.audit import BlockAuditWriter
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.const import BlockAudit, DomainBlock
+
+
+def make_blocklists():
+    return [
+        Blocklist(
+            "list01",
+            {
+                "all.example.org": DomainBlock("all.example.org", "silence"),
+                "one.example.org": DomainBlock("one.example.org", "suspend"),
+            },
+        ),
+        Blocklist(
+            "list02",
+            {
+                "all.example.org": DomainBlock("all.example.org", "suspend"),
+                "two.example.org": DomainBlock("two.example.org", "silence"),
+            },
+        ),
+    ]
+
+
+def test_writer_streams_rows(tmp_path):
+    auditfile = tmp_path / "audit.csv"
+
+    with BlockAuditWriter(str(auditfile)) as audit:
+        audit.write(BlockAudit("example.org", 1, 50.0, 1.0, "list01"))
+        # Nothing is visible until the audit is complete
+        assert not auditfile.exists()
+
+    assert audit.rows == 1
+    assert auditfile.read_text().splitlines() == [
+        "domain,count,percent,score,sources",
+        "example.org,1,50.0,1.0,list01",
+    ]
+
+
+def test_writer_leaves_no_partial_file(tmp_path):
+    auditfile = tmp_path / "audit.csv"
+    auditfile.write_text("previous audit\n")
+
+    with pytest.raises(RuntimeError):
+        with BlockAuditWriter(str(auditfile)) as audit:
+            audit.write(BlockAudit("example.org", 1, 50.0, 1.0, "list01"))
+            raise RuntimeError("merge failed")
+
+    assert auditfile.read_text() == "previous audit\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["audit.csv"]
+
+
+def test_writer_follows_umask(tmp_path, monkeypatch):
+    """The audit file gets the usual permissions, not the temporary file's"""
+    monkeypatch.setattr(fediblockhole.tempfiles, "UMASK", 0o022)
+    auditfile = str(tmp_path / "audit.csv")
+
+    with BlockAuditWriter(auditfile):
+        pass
+
+    assert stat.S_IMODE(os.stat(auditfile).st_mode) == 0o644
+
+
+def test_writer_without_file():
+    with BlockAuditWriter(None) as audit:
+        audit.write(BlockAudit("example.org"))
+
+    assert audit.rows == 0
+
+
+@pytest.mark.parametrize("merge", [merge_blocklists, merge_blocklists_streaming])
+def test_audit_detail(tmp_path, merge):
+    auditfile = tmp_path / "audit.csv"
+
+    merge(
+        make_blocklists(),
+        "max",
+        2,
+        save_block_audit_file=str(auditfile),
+        audit_detail=True,
+    )
+
+    lines = auditfile.read_text().splitlines()
+    assert lines[0] == "domain,count,percent,score,sources,severity,list01,list02"
+    assert sorted(lines[1:]) == [
+        "all.example.org,2,100.0,2.0,list01 list02,suspend,1,1",
+        "one.example.org,1,50.0,1.0,list01,,1,0",
+        "two.example.org,1,50.0,1.0,list02,,0,1",
+    ]
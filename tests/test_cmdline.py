@@ -49,3 +49,11 @@ def test_set_multiple_allow_domains():
     )
 
     assert args.allow_domains == ["example.org", "example2.org", "example3.org"]
+
+
+def test_set_explain_domains():
+    """Ask which blocklists block some domains"""
+    ap = setup_argparse()
+    args = ap.parse_args(["--explain", "example.org", "--explain", "example2.org"])
+
+    assert args.explain_domains == ["example.org", "example2.org"]
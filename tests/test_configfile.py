@@ -94,6 +94,17 @@ merge_threshold = 35
     assert args.merge_threshold == 35
 
 
+def test_set_merge_thresold_weighted():
+    tomldata = """# Add a weighted merge threshold
+merge_threshold_type = 'weighted'
+merge_threshold = 1.5
+"""
+    args = shim_argparse([], tomldata)
+
+    assert args.merge_threshold_type == "weighted"
+    assert args.merge_threshold == 1.5
+
+
 def test_destination_token_from_environment(monkeypatch):
     tomldata = dedent(
         """\
@@ -140,3 +151,27 @@ def test_instance_sources_token_from_environment(monkeypatch):
     assert args.blocklist_instance_sources[1]["token"] == "env-token"
     assert args.blocklist_instance_sources[2]["token"] == "env-token"
     assert args.blocklist_instance_sources[3]["token"] == "www-env-token"
+
+
+def test_set_merge_mode_default():
+    tomldata = """
+"""
+    args = shim_argparse([], tomldata)
+
+    assert args.merge_mode == "standard"
+
+
+def test_set_merge_mode_streaming():
+    tomldata = """merge_mode = 'streaming'
+"""
+    args = shim_argparse([], tomldata)
+
+    assert args.merge_mode == "streaming"
+
+
+def test_set_collapse_subdomains():
+    tomldata = """collapse_subdomains = true
+"""
+    args = shim_argparse([], tomldata)
+
+    assert args.collapse_subdomains is True
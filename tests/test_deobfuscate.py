@@ -0,0 +1,78 @@
+"""Test working out the real domains of obfuscated blocks
+"""
+
+import json
+
+from fediblockhole.blocklists import (
+    Blocklist,
+    deobfuscate_blocklists,
+    domain_digest,
+    parse_blocklist,
+)
+from fediblockhole.const import DomainBlock
+
+import_fields = ["domain", "severity", "public_comment"]
+
+
+def public_api_data():
+    return json.dumps(
+        [
+            {
+                "domain": "b*d.example",
+                "digest": domain_digest("bad.example"),
+                "severity": "suspend",
+                "comment": "spam",
+            },
+            {
+                "domain": "u*k*own.example",
+                "digest": domain_digest("unknown.example"),
+                "severity": "silence",
+                "comment": "",
+            },
+        ]
+    )
+
+
+def test_public_api_keeps_digest():
+    bl = parse_blocklist(
+        public_api_data(), "public", "mastodon_api_public", import_fields
+    )
+
+    assert bl["b*d.example"].domain_digest == domain_digest("bad.example")
+    assert bl["b*d.example"].public_comment == "spam"
+    assert "digest" not in bl["b*d.example"]._asdict()
+
+
+def test_deobfuscate():
+    public = parse_blocklist(
+        public_api_data(), "public", "mastodon_api_public", import_fields
+    )
+    plain = Blocklist("plain", {"bad.example": DomainBlock("bad.example", "silence")})
+
+    recovered = deobfuscate_blocklists([public, plain])
+
+    assert recovered == 1
+    assert list(public) == ["bad.example", "u*k*own.example"]
+    assert public["bad.example"].domain == "bad.example"
+    assert public["bad.example"].severity.level > plain["bad.example"].severity.level
+
+
+def test_deobfuscate_keeps_plain_block():
+    """A plain block in the same list wins over a recovered one"""
+    public = parse_blocklist(
+        public_api_data(), "public", "mastodon_api_public", import_fields
+    )
+    public.blocks["bad.example"] = DomainBlock("bad.example", "noop")
+
+    recovered = deobfuscate_blocklists([public])
+
+    assert recovered == 1
+    assert list(public) == ["u*k*own.example", "bad.example"]
+    assert str(public["bad.example"].severity) == "noop"
+
+
+def test_deobfuscate_without_obfuscated():
+    plain = Blocklist("plain", {"bad.example": DomainBlock("bad.example")})
+
+    assert deobfuscate_blocklists([plain]) == 0
+    assert list(plain) == ["bad.example"]
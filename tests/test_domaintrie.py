@@ -0,0 +1,130 @@
+"""Test the domain trie and collapsing subdomain blocks
+"""
+
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.const import DomainBlock
+from fediblockhole.domaintrie import (
+    DomainTrie,
+    collapse_subdomains,
+    find_redundant_subdomains,
+    find_rejected_blocks,
+    stricter_than,
+)
+
+
+def make_blocklist(*blocks):
+    return Blocklist("test", {b.domain: b for b in blocks})
+
+
+def test_trie_insert_and_get():
+    trie = DomainTrie()
+    trie.insert("bad.example", 1)
+    trie.insert("a.bad.example", 2)
+
+    assert len(trie) == 2
+    assert "bad.example" in trie
+    assert "example" not in trie
+    assert "b.bad.example" not in trie
+    assert trie.get("a.bad.example") == 2
+    assert trie.get("b.bad.example") is None
+
+
+def test_trie_parents():
+    trie = DomainTrie()
+    trie.insert("example", "tld")
+    trie.insert("bad.example", "parent")
+    trie.insert("x.a.bad.example", "child")
+
+    assert list(trie.parents("x.a.bad.example")) == [
+        ("example", "tld"),
+        ("bad.example", "parent"),
+    ]
+    assert list(trie.parents("bad.example")) == [("example", "tld")]
+    assert list(trie.parents("other.org")) == []
+
+
+def test_collapse_covered_subdomains():
+    bl = make_blocklist(
+        DomainBlock("a.bad.example", "suspend"),
+        DomainBlock("bad.example", "suspend"),
+        DomainBlock("b.bad.example", "silence", reject_media=True),
+        DomainBlock("notbad.example", "suspend"),
+    )
+
+    redundant = collapse_subdomains(bl)
+
+    assert redundant == {
+        "a.bad.example": "bad.example",
+        "b.bad.example": "bad.example",
+    }
+    assert list(bl) == ["bad.example", "notbad.example"]
+
+
+def test_keep_stricter_subdomains():
+    bl = make_blocklist(
+        DomainBlock("bad.example", "silence"),
+        DomainBlock("a.bad.example", "suspend"),
+        DomainBlock("b.bad.example", "silence", reject_media=True),
+        DomainBlock("c.bad.example", "silence"),
+        DomainBlock("d.bad.example", "noop"),
+    )
+
+    assert find_redundant_subdomains(bl) == {
+        "c.bad.example": "bad.example",
+        "d.bad.example": "bad.example",
+    }
+
+
+def test_covered_by_grandparent():
+    bl = make_blocklist(
+        DomainBlock("bad.example", "suspend"),
+        DomainBlock("a.bad.example", "silence"),
+        DomainBlock("x.a.bad.example", "suspend"),
+    )
+
+    assert find_redundant_subdomains(bl) == {
+        "a.bad.example": "bad.example",
+        "x.a.bad.example": "bad.example",
+    }
+
+
+def test_flag_without_removing():
+    bl = make_blocklist(
+        DomainBlock("bad.example", "suspend"),
+        DomainBlock("a.bad.example", "suspend"),
+    )
+
+    redundant = collapse_subdomains(bl, remove=False)
+
+    assert redundant == {"a.bad.example": "bad.example"}
+    assert len(bl) == 2
+
+
+def test_stricter_than():
+    suspend = DomainBlock("bad.example", "suspend")
+    silence = DomainBlock("bad.example", "silence")
+    noop = DomainBlock("bad.example", "noop")
+    media = DomainBlock("bad.example", "silence", reject_media=True)
+
+    assert stricter_than(DomainBlock("a.bad.example", "suspend"), suspend)
+    assert not stricter_than(DomainBlock("a.bad.example", "silence"), suspend)
+    assert not stricter_than(DomainBlock("a.bad.example", "noop"), silence)
+    assert stricter_than(DomainBlock("a.bad.example", "silence"), silence)
+    assert stricter_than(DomainBlock("a.bad.example", "noop", reject_media=True), noop)
+    assert not stricter_than(DomainBlock("a.bad.example", "silence"), media)
+
+
+def test_find_rejected_blocks():
+    existing = make_blocklist(
+        DomainBlock("bad.example", "suspend"),
+        DomainBlock("ok.bad.example", "noop"),
+    )
+    blocks = [
+        DomainBlock("a.bad.example", "silence"),
+        DomainBlock("b.bad.example", "suspend"),
+        DomainBlock("x.ok.bad.example", "silence"),
+        DomainBlock("other.example", "noop"),
+    ]
+
+    # Only the closest parent's block counts
+    assert find_rejected_blocks(existing, blocks) == {"a.bad.example": "bad.example"}
@@ -0,0 +1,133 @@
+"""Test caching follow counts between runs
+"""
+
+import threading
+import time
+
+import pytest
+from util import shim_argparse
+
+import fediblockhole
+from fediblockhole import get_instance_follows
+from fediblockhole.followcache import FollowCache
+
+
+@pytest.fixture
+def follows(monkeypatch):
+    """Count calls to a fake measures API"""
+    calls = []
+
+    def fake_fetch(token, host, domain, scheme="https"):
+        calls.append((host, domain))
+        return 7
+
+    monkeypatch.setattr(fediblockhole, "API_CALL_DELAY", 0)
+    monkeypatch.setattr(fediblockhole, "fetch_instance_follows", fake_fetch)
+    return calls
+
+
+def wait_for(condition, timeout=5):
+    """Wait for a background refresh to get going"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def follows_for(cache, host="fake.host", domain="bad.example"):
+    return get_instance_follows("token", host, domain, "https", cache)
+
+
+def test_cache_miss_then_hit(tmp_path, follows):
+    cachefile = str(tmp_path / "follows.json")
+
+    cache = FollowCache.load(cachefile)
+    assert follows_for(cache) == 7
+    cache.close()
+
+    # The next run uses the saved count
+    cache = FollowCache.load(cachefile)
+    assert follows_for(cache) == 7
+    cache.close()
+
+    assert follows == [("fake.host", "bad.example")]
+    assert cache.hits == 1
+
+
+def test_cache_is_per_host(tmp_path, follows):
+    cache = FollowCache(str(tmp_path / "follows.json"))
+
+    follows_for(cache, "one.host")
+    follows_for(cache, "two.host")
+
+    assert follows == [("one.host", "bad.example"), ("two.host", "bad.example")]
+
+
+def test_stale_while_revalidate(tmp_path, follows):
+    cache = FollowCache(str(tmp_path / "follows.json"), ttl=60, max_stale=600)
+    # Older than the ttl, but not too stale to use
+    cache.entries = {"fake.host": {"bad.example": [3, time.time() - 100]}}
+
+    # The stale count is used straight away...
+    assert follows_for(cache) == 3
+    wait_for(lambda: follows)
+    cache.close()
+
+    # ...and refreshed in the background for next time
+    assert follows == [("fake.host", "bad.example")]
+    assert cache.get("fake.host", "bad.example") == (7, True)
+
+
+def test_close_drops_unstarted_refreshes(tmp_path):
+    cache = FollowCache(str(tmp_path / "follows.json"), ttl=60, max_stale=600)
+    started = threading.Event()
+    fetched = []
+
+    def slow_fetch():
+        started.set()
+        # Still in flight when the cache is closed
+        time.sleep(0.5)
+        fetched.append("slow.example")
+        return 1
+
+    cache.revalidate("fake.host", "slow.example", slow_fetch)
+    started.wait(5)
+    # Queued behind the refresh in flight for the same instance
+    cache.revalidate("fake.host", "queued.example", lambda: fetched.append(0) or 2)
+    # Refreshes for other instances don't wait for it
+    done = threading.Event()
+    cache.revalidate("other.host", "bad.example", lambda: done.set() or 3)
+    assert done.wait(5)
+
+    cache.close()
+
+    assert fetched == ["slow.example"]
+    assert cache.refreshed == 2
+    assert cache.get("fake.host", "queued.example") == (None, False)
+
+
+def test_too_stale_is_fetched(tmp_path, follows):
+    cache = FollowCache(str(tmp_path / "follows.json"), ttl=60, max_stale=600)
+    cache.entries = {"fake.host": {"bad.example": [3, 0]}}
+
+    assert follows_for(cache) == 7
+    assert follows == [("fake.host", "bad.example")]
+
+
+def test_unreadable_cache(tmp_path):
+    cachefile = tmp_path / "follows.json"
+    cachefile.write_text("not json")
+
+    cache = FollowCache.load(str(cachefile))
+
+    assert cache.entries == {}
+
+
+def test_follow_cache_config():
+    tomldata = """follow_cache_file = '/tmp/follows.json'
+follow_cache_ttl = 600
+"""
+    args = shim_argparse([], tomldata)
+
+    assert args.follow_cache_file == "/tmp/follows.json"
+    assert args.follow_cache_ttl == 600
+    assert args.follow_cache_max_stale == 2592000
@@ -0,0 +1,60 @@
+"""Test string interning across parsed blocklists
+"""
+
+from fediblockhole.blocklists import InternTable, parse_blocklist
+
+import_fields = [
+    "domain",
+    "severity",
+    "public_comment",
+    "private_comment",
+    "reject_media",
+    "reject_reports",
+    "obfuscate",
+]
+
+
+def test_intern_returns_canonical():
+    interns = InternTable()
+
+    a = "".join(["example", ".org"])
+    b = "".join(["example", ".org"])
+    assert a is not b
+
+    assert interns.intern(a) is a
+    assert interns.intern(b) is a
+    assert len(interns) == 1
+    assert interns.hits == 1
+    assert interns.bytes_saved > 0
+
+
+def test_intern_ignores_non_strings():
+    interns = InternTable()
+
+    assert interns.intern(None) is None
+    assert len(interns) == 0
+
+
+def test_intern_across_blocklists(data_suspends_01, data_silences_01):
+    interns = InternTable()
+
+    bl1 = parse_blocklist(
+        data_suspends_01, "one", "csv", import_fields, interns=interns
+    )
+    bl2 = parse_blocklist(
+        data_silences_01, "two", "csv", import_fields, interns=interns
+    )
+
+    domain = "public-comment.example.org"
+    assert bl1[domain].domain is bl2[domain].domain
+    assert bl1[domain].public_comment is bl2[domain].public_comment
+    assert bl1[domain].private_comment is bl2[domain].private_comment
+    assert interns.bytes_saved > 0
+
+
+def test_no_intern_by_default(data_suspends_01, data_silences_01):
+    bl1 = parse_blocklist(data_suspends_01, "one", "csv", import_fields)
+    bl2 = parse_blocklist(data_silences_01, "two", "csv", import_fields)
+
+    domain = "public-comment.example.org"
+    assert bl1[domain].public_comment == bl2[domain].public_comment
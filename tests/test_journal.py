@@ -0,0 +1,120 @@
+"""Test resuming interrupted pushes from a journal
+"""
+
+import os
+
+import pytest
+
+import fediblockhole
+from fediblockhole import push_blocklist
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.changeset import BlockChange, Changeset
+from fediblockhole.const import DomainBlock
+from fediblockhole.journal import PushJournal
+
+
+def make_changeset():
+    changeset = Changeset("fake.host")
+    changeset.adds = [
+        BlockChange(DomainBlock("one.example", "suspend")),
+        BlockChange(DomainBlock("two.example", "silence")),
+    ]
+    changeset.updates = [
+        BlockChange(
+            DomainBlock("three.example", "suspend", id=3),
+            DomainBlock("three.example", "silence", id=3),
+            ["severity"],
+        )
+    ]
+    changeset.noops = ["four.example"]
+    return changeset
+
+
+def test_resume_remaining_changes(tmp_path):
+    filepath = str(tmp_path / "journal.jsonl")
+    journal = PushJournal(filepath, "fake.host", "key")
+    changeset = make_changeset()
+    journal.start(changeset)
+    journal.record(changeset.adds[0])
+    journal.close()
+
+    journal = PushJournal.load(filepath, "fake.host", "key")
+    remaining = journal.remaining()
+
+    assert journal.done == {"one.example"}
+    assert [c.domain for c in remaining.adds] == ["two.example"]
+    assert remaining.noops == ["four.example"]
+    update = remaining.updates[0]
+    assert update.block.id == 3
+    assert update.diffs == ["severity"]
+    assert str(update.old.severity) == "silence"
+
+
+def test_partial_line_ignored(tmp_path):
+    filepath = str(tmp_path / "journal.jsonl")
+    journal = PushJournal(filepath, "fake.host", "key")
+    changeset = make_changeset()
+    journal.start(changeset)
+    journal.record(changeset.adds[0])
+    journal.close()
+    with open(filepath, "a") as fp:
+        fp.write('{"done": "two.ex')
+
+    journal = PushJournal.load(filepath, "fake.host", "key")
+
+    assert journal.done == {"one.example"}
+
+
+def test_different_push_ignored(tmp_path):
+    filepath = str(tmp_path / "journal.jsonl")
+    journal = PushJournal(filepath, "fake.host", "key")
+    journal.start(make_changeset())
+    journal.close()
+
+    assert PushJournal.load(filepath, "fake.host", "other").changeset is None
+    assert PushJournal.load(filepath, "other.host", "key").changeset is None
+
+
+def test_push_resumes_after_failure(monkeypatch, tmp_path):
+    added = []
+    fetches = []
+    # Adding two.example fails the first time
+    failures = ["two.example"]
+
+    def fetch_instance_blocklist(host, token, admin, import_fields, scheme):
+        fetches.append(host)
+        return Blocklist("fake")
+
+    def add_block(token, host, block, scheme):
+        if block.domain in failures:
+            failures.remove(block.domain)
+            raise ValueError("Something went wrong")
+        added.append(block.domain)
+
+    monkeypatch.setattr(fediblockhole, "API_CALL_DELAY", 0)
+    monkeypatch.setattr(
+        fediblockhole, "fetch_instance_blocklist", fetch_instance_blocklist
+    )
+    monkeypatch.setattr(fediblockhole, "add_block", add_block)
+    journalfile = str(tmp_path / "journal.jsonl")
+    merged = Blocklist(
+        "merged",
+        {
+            "one.example": DomainBlock("one.example", "silence"),
+            "two.example": DomainBlock("two.example", "silence"),
+            "three.example": DomainBlock("three.example", "silence"),
+        },
+    )
+
+    with pytest.raises(ValueError):
+        push_blocklist("token", "fake.host", merged, journal_file=journalfile)
+    assert added == ["one.example"]
+    assert os.path.exists(journalfile)
+
+    stats = push_blocklist("token", "fake.host", merged, journal_file=journalfile)
+
+    # The push carried on without fetching the instance's blocks again
+    assert fetches == ["fake.host"]
+    assert added == ["one.example", "two.example", "three.example"]
+    assert stats["added"] == 2
+    assert not os.path.exists(journalfile)
@@ -0,0 +1,94 @@
+"""Test tracking which blocklists contributed each merged domain
+"""
+
+import logging
+
+from fediblockhole import (
+    explain_domains,
+    merge_blocklists,
+    merge_blocklists_streaming,
+)
+from fediblockhole.blocklists import Blocklist, iter_bitset
+from fediblockhole.const import DomainBlock
+
+
+def make_blocklists():
+    bl_1 = Blocklist(
+        "list01",
+        {
+            "one.example.org": DomainBlock("one.example.org"),
+            "all.example.org": DomainBlock("all.example.org"),
+        },
+    )
+    bl_2 = Blocklist(
+        "list02",
+        {
+            "all.example.org": DomainBlock("all.example.org"),
+            "two.example.org": DomainBlock("two.example.org"),
+        },
+    )
+    bl_3 = Blocklist(
+        "list03",
+        {
+            "two.example.org": DomainBlock("two.example.org"),
+            "all.example.org": DomainBlock("all.example.org"),
+        },
+    )
+    return [bl_1, bl_2, bl_3]
+
+
+def test_iter_bitset():
+    assert list(iter_bitset(0)) == []
+    assert list(iter_bitset(0b1)) == [0]
+    assert list(iter_bitset(0b10110)) == [1, 2, 4]
+
+
+def test_sources_for():
+    merged = merge_blocklists(make_blocklists())
+
+    assert merged.sources == ["list01", "list02", "list03"]
+    assert merged.membership["all.example.org"] == 0b111
+    assert merged.sources_for("all.example.org") == ["list01", "list02", "list03"]
+    assert merged.sources_for("one.example.org") == ["list01"]
+    assert merged.sources_for("two.example.org") == ["list02", "list03"]
+    assert merged.sources_for("nothere.example.org") == []
+
+
+def test_sources_for_merge_modes():
+    expected = merge_blocklists(make_blocklists(), threshold=2).membership
+
+    streamed = merge_blocklists_streaming(make_blocklists(), threshold=2)
+    assert streamed.membership == expected
+
+
+def test_audit_sources(tmp_path):
+    auditfile = tmp_path / "audit.csv"
+
+    merge_blocklists(make_blocklists(), save_block_audit_file=str(auditfile))
+
+    lines = auditfile.read_text().splitlines()
+    assert lines[0] == "domain,count,percent,score,sources"
+    assert "all.example.org,3,100.0,3.0,list01 list02 list03" in lines
+    assert "two.example.org,2,66.66666666666666,2.0,list02 list03" in lines
+
+
+def test_explain_removed_domains(caplog):
+    merged = merge_blocklists(make_blocklists())
+    del merged.blocks["one.example.org"]
+    del merged.blocks["two.example.org"]
+
+    with caplog.at_level(logging.INFO):
+        explain_domains(
+            merged,
+            ["all.example.org", "one.example.org", "two.example.org", "no.example"],
+            {"two.example.org": "example.org"},
+        )
+
+    assert "'all.example.org' is blocked by: list01, list02, list03" in caplog.text
+    assert "'all.example.org' was removed" not in caplog.text
+    assert "'one.example.org' was removed by an allowlist." in caplog.text
+    assert (
+        "'two.example.org' was removed, as the block for 'example.org' covers it."
+        in caplog.text
+    )
+    assert "'no.example' is not in the merged blocklist." in caplog.text
@@ -1,7 +1,7 @@
 """ Test merging of comments
 """
 
-from fediblockhole import merge_comments
+from fediblockhole import CommentMerger, merge_comments
 
 
 def test_merge_blank_comments():
@@ -72,3 +72,58 @@ def test_merge_overlaps():
     merged_comment = merge_comments(oldcomment, newcomment)
 
     assert merged_comment == "happy, medium, spinning, fred, bibble"
+
+
+def test_merge_dups_within_comment():
+
+    oldcomment = "spam, spam, bots"
+    newcomment = "bots, nazis, nazis"
+
+    merged_comment = merge_comments(oldcomment, newcomment)
+
+    # Tokens repeated within a comment are kept, as they always have been
+    assert merged_comment == "spam, spam, bots, nazis, nazis"
+
+
+def test_merge_empty_tokens():
+
+    oldcomment = "spam, , bots"
+    newcomment = ", nazis"
+
+    merged_comment = merge_comments(oldcomment, newcomment)
+
+    assert merged_comment == "spam, bots, nazis"
+
+
+def test_comment_merger_many():
+    """Comments from many sources merge in one pass, keeping first-seen order"""
+
+    merger = CommentMerger()
+    for comment in ["", "spam", None, "spam", "bots, spam", "nazis, bots", ""]:
+        merger.add(comment)
+
+    assert merger.merged() == "spam, bots, nazis"
+
+
+def test_comment_merger_single():
+
+    merger = CommentMerger("fred, bibble")
+    merger.add("fred, bibble")
+    merger.add("")
+
+    assert merger.merged() == "fred, bibble"
+
+
+def test_comment_merger_empty():
+
+    assert CommentMerger().merged() == ""
+
+
+def test_merge_repeated_tokens_like_pairwise():
+    """Repeats are only skipped as many times as we already have the token"""
+    merger = CommentMerger("a")
+    merger.add("a, a")
+    merger.add("a, a, a, b")
+
+    assert merger.merged() == merge_comments(merge_comments("a", "a, a"), "a, a, a, b")
+    assert merger.merged() == "a, a, a, b"
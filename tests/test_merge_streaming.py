@@ -0,0 +1,117 @@
+"""Test the streaming k-way merge
+"""
+
+from fediblockhole import (
+    iter_merged_blocks,
+    merge_blocklists,
+    merge_blocklists_streaming,
+)
+from fediblockhole.blocklists import Blocklist, parse_blocklist
+from fediblockhole.const import DomainBlock
+
+import_fields = [
+    "domain",
+    "severity",
+    "public_comment",
+    "private_comment",
+    "reject_media",
+    "reject_reports",
+    "obfuscate",
+]
+
+
+def load_test_blocklist_data(datafiles):
+
+    blocklists = []
+
+    for data in datafiles:
+        bl = parse_blocklist(data, "pytest", "csv", import_fields)
+        blocklists.append(bl)
+
+    return blocklists
+
+
+def as_dicts(blocklist):
+    return {domain: block._asdict() for domain, block in blocklist.items()}
+
+
+def test_streaming_matches_standard(data_suspends_01, data_silences_01, data_noop_01):
+    for mergeplan in ["max", "min"]:
+        blocklists = load_test_blocklist_data(
+            [data_suspends_01, data_silences_01, data_noop_01]
+        )
+        expected = merge_blocklists(blocklists, mergeplan)
+        bl = merge_blocklists_streaming(blocklists, mergeplan)
+
+        assert as_dicts(bl) == as_dicts(expected)
+
+
+def test_streaming_domain_order(data_suspends_01, data_silences_01):
+    blocklists = load_test_blocklist_data([data_suspends_01, data_silences_01])
+
+    bl = merge_blocklists_streaming(blocklists)
+
+    assert list(bl) == sorted(bl)
+
+
+def test_streaming_threshold():
+    bl_1 = Blocklist(
+        "test01",
+        {
+            "onemention.example.org": DomainBlock("onemention.example.org"),
+            "twomention.example.org": DomainBlock("twomention.example.org"),
+        },
+    )
+    bl_2 = Blocklist(
+        "test02",
+        {
+            "twomention.example.org": DomainBlock("twomention.example.org"),
+            "*.example.org": DomainBlock("*.example.org"),
+        },
+    )
+
+    ml = merge_blocklists_streaming([bl_1, bl_2], "max", threshold=2)
+
+    assert "onemention.example.org" not in ml
+    assert "twomention.example.org" in ml
+    assert "*.example.org" not in ml
+
+
+def test_iter_merged_blocks_generators():
+    """Sources can be any domain-sorted iterables"""
+
+    def source(domains, severity):
+        for domain in domains:
+            yield DomainBlock(domain, severity)
+
+    merged = list(
+        iter_merged_blocks(
+            [
+                source(["a.example", "c.example"], "silence"),
+                source(["b.example", "c.example"], "suspend"),
+            ],
+            "min",
+        )
+    )
+
+    assert [audit["domain"] for block, membership, audit in merged] == [
+        "a.example",
+        "b.example",
+        "c.example",
+    ]
+    block, membership, audit = merged[2]
+    assert str(block.severity) == "silence"
+    assert membership == 0b11
+    assert audit["count"] == 2
+    assert audit["percent"] == 100
+
+
+def test_streaming_audit_file(tmp_path, data_suspends_01, data_silences_01):
+    blocklists = load_test_blocklist_data([data_suspends_01, data_silences_01])
+    auditfile = tmp_path / "audit.csv"
+
+    merge_blocklists_streaming(blocklists, save_block_audit_file=str(auditfile))
+
+    lines = auditfile.read_text().splitlines()
+    assert lines[0] == "domain,count,percent,score,sources"
+    assert len(lines) == 14
@@ -1,7 +1,17 @@
 """Test merge with thresholds
 """
 
-from fediblockhole import merge_blocklists
+from array import array
+
+import pytest
+
+import fediblockhole
+from fediblockhole import (
+    merge_blocklists,
+    merge_blocklists_streaming,
+    source_weight,
+    threshold_mask,
+)
 from fediblockhole.blocklists import Blocklist, parse_blocklist
 from fediblockhole.const import DomainBlock
 
@@ -260,3 +270,154 @@ def test_mergeplan_pct_55():
     assert "twomention.example.org" not in ml
     assert "threemention.example.org" in ml
     assert "fourmention.example.org" in ml
+
+
+def test_threshold_mask_count():
+    counts = array("L", [1, 2, 3, 1])
+
+    passed = threshold_mask(counts, 4, 2, "count")
+
+    assert [bool(p) for p in passed] == [False, True, True, False]
+
+
+def test_threshold_mask_pct():
+    counts = array("L", [1, 2, 3, 4])
+
+    passed = threshold_mask(counts, 4, 55, "pct")
+
+    assert [bool(p) for p in passed] == [False, False, True, True]
+
+
+def test_threshold_mask_bad_type():
+    with pytest.raises(ValueError):
+        threshold_mask(array("L", [1]), 1, 1, "median")
+
+
+def test_threshold_mask_without_numpy(monkeypatch):
+    monkeypatch.setattr(fediblockhole, "np", None)
+    counts = array("L", [1, 2, 3, 4])
+
+    assert list(threshold_mask(counts, 4, 30, "pct")) == [False, True, True, True]
+    assert list(threshold_mask(counts, 4, 3, "count")) == [False, False, True, True]
+
+
+def test_threshold_mask_with_numpy(monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    monkeypatch.setattr(fediblockhole, "np", numpy)
+    counts = array("L", [1, 2, 3, 4])
+
+    assert list(threshold_mask(counts, 4, 30, "pct")) == [False, True, True, True]
+    assert list(threshold_mask(counts, 4, 3, "count")) == [False, False, True, True]
+
+
+def test_threshold_keeps_order(monkeypatch):
+    """Merged domains stay in the order they were first seen"""
+    monkeypatch.setattr(fediblockhole, "np", None)
+    bl_1 = Blocklist(
+        "test01",
+        {
+            "c.example.org": DomainBlock("c.example.org"),
+            "a.example.org": DomainBlock("a.example.org"),
+        },
+    )
+    bl_2 = Blocklist(
+        "test02",
+        {
+            "b.example.org": DomainBlock("b.example.org"),
+            "a.example.org": DomainBlock("a.example.org"),
+            "c.example.org": DomainBlock("c.example.org"),
+        },
+    )
+
+    ml = merge_blocklists([bl_1, bl_2], "max", threshold=2)
+
+    assert list(ml) == ["c.example.org", "a.example.org"]
+
+
+def make_weighted_blocklists():
+    trusted = Blocklist(
+        "trusted",
+        {
+            "both.example.org": DomainBlock("both.example.org", "suspend"),
+            "trusted.example.org": DomainBlock("trusted.example.org", "suspend"),
+        },
+    )
+    noisy = Blocklist(
+        "noisy",
+        {
+            "noisy.example.org": DomainBlock("noisy.example.org", "suspend"),
+            "both.example.org": DomainBlock("both.example.org", "suspend"),
+        },
+        weight=0.5,
+    )
+    return [trusted, noisy]
+
+
+def test_threshold_mask_weighted(monkeypatch):
+    monkeypatch.setattr(fediblockhole, "np", None)
+    counts = array("L", [1, 2, 1])
+    scores = array("d", [0.5, 1.5, 1.0])
+
+    assert list(threshold_mask(counts, 2, 1, "weighted", scores)) == [
+        False,
+        True,
+        True,
+    ]
+
+
+def test_threshold_mask_weighted_with_numpy(monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    monkeypatch.setattr(fediblockhole, "np", numpy)
+    counts = array("L", [1, 2, 1])
+    scores = array("d", [0.5, 1.5, 1.0])
+
+    assert list(threshold_mask(counts, 2, 1, "weighted", scores)) == [
+        False,
+        True,
+        True,
+    ]
+
+
+def test_threshold_mask_weighted_needs_scores():
+    with pytest.raises(ValueError):
+        threshold_mask(array("L", [1]), 1, 1, "weighted")
+
+
+def test_merge_weighted():
+    """A noisy source needs backing up before its blocks are merged"""
+    ml = merge_blocklists(make_weighted_blocklists(), "max", 1, "weighted")
+
+    assert sorted(ml) == ["both.example.org", "trusted.example.org"]
+
+
+def test_merge_weighted_streaming():
+    ml = merge_blocklists_streaming(make_weighted_blocklists(), "max", 1, "weighted")
+
+    assert sorted(ml) == ["both.example.org", "trusted.example.org"]
+
+
+def test_weighted_audit_score(tmp_path):
+    auditfile = tmp_path / "audit.csv"
+
+    merge_blocklists(
+        make_weighted_blocklists(),
+        "max",
+        1,
+        "weighted",
+        save_block_audit_file=str(auditfile),
+    )
+
+    lines = auditfile.read_text().splitlines()
+    assert lines[0] == "domain,count,percent,score,sources"
+    assert "both.example.org,2,100.0,1.5,trusted noisy" in lines
+    assert "noisy.example.org,1,50.0,0.5,noisy" in lines
+
+
+def test_source_weight():
+    assert source_weight({"url": "file:///tmp/list.csv"}) == 1.0
+    assert source_weight({"url": "file:///tmp/list.csv", "weight": 0.25}) == 0.25
+
+    with pytest.raises(ValueError):
+        source_weight({"url": "file:///tmp/list.csv", "weight": -1})
+    with pytest.raises(ValueError):
+        source_weight({"url": "file:///tmp/list.csv", "weight": "high"})
@@ -1,7 +1,14 @@
 """Various mergeplan tests
 """
 
-from fediblockhole import apply_mergeplan, merge_blocklists, merge_comments
+import pytest
+
+from fediblockhole import (
+    apply_mergeplan,
+    merge_blocklists,
+    merge_blocks,
+    merge_comments,
+)
 from fediblockhole.blocklists import parse_blocklist
 from fediblockhole.const import DomainBlock, SeverityLevel
 
@@ -266,3 +273,66 @@ def test_mergeplan_max_bools():
     assert r.reject_media is True
     assert r.reject_reports is True
     assert r.obfuscate is True
+
+
+def test_merge_blocks_single():
+    """A single block is returned as-is"""
+    a = DomainBlock("example.org", "silence", "spam")
+
+    assert merge_blocks([a], "max") is a
+
+
+def test_merge_blocks_max():
+    blocks = [
+        DomainBlock("example.org", "noop", "spam", "", False, False, False),
+        DomainBlock("example.org", "suspend", "nazis", "", False, True, False),
+        DomainBlock("example.org", "silence", "spam, bots", "", True, False, False),
+    ]
+
+    r = merge_blocks(blocks, "max")
+
+    assert r.severity.level == SeverityLevel.SUSPEND
+    assert r.public_comment == "spam, nazis, bots"
+    assert r.reject_media is True
+    assert r.reject_reports is True
+    assert r.obfuscate is False
+
+
+def test_merge_blocks_min():
+    blocks = [
+        DomainBlock("example.org", "suspend", "spam", "", True, True, True),
+        DomainBlock("example.org", "noop", "", "", True, False, True),
+        DomainBlock("example.org", "silence", "bots", "", False, True, True),
+    ]
+
+    r = merge_blocks(blocks, "min")
+
+    assert r.severity.level == SeverityLevel.NONE
+    assert r.public_comment == "spam, bots"
+    assert r.reject_media is False
+    assert r.reject_reports is False
+    assert r.obfuscate is True
+
+
+def test_merge_blocks_matches_pairwise():
+    """Merging all at once is the same as merging pairwise"""
+    blocks = [
+        DomainBlock("example.org", "silence", "a, b", "x", False, True, False),
+        DomainBlock("example.org", "suspend", "b, c", "", True, False, False),
+        DomainBlock("example.org", "noop", "", "y", False, False, True),
+    ]
+
+    for mergeplan in ["max", "min"]:
+        expected = blocks[0]
+        for block in blocks[1:]:
+            expected = apply_mergeplan(expected, block, mergeplan)
+
+        assert merge_blocks(blocks, mergeplan)._asdict() == expected._asdict()
+
+
+def test_merge_blocks_bad_mergeplan():
+    a = DomainBlock("example.org", "silence")
+    b = DomainBlock("example.org", "suspend")
+
+    with pytest.raises(NotImplementedError):
+        merge_blocks([a, b], "median")
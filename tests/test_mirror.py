@@ -0,0 +1,218 @@
+"""Test mirroring destination instance blocklists
+"""
+
+import json
+
+import pytest
+
+import fediblockhole
+from fediblockhole import fetch_mirrored_blocklist, push_blocklist, refresh_mirror
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.const import DomainBlock
+from fediblockhole.mirror import InstanceMirror
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode("utf-8")
+
+
+class FakeAdminAPI:
+    """Answers admin domain_blocks requests like Mastodon does"""
+
+    def __init__(self):
+        self.blocks = {}
+        self.requests = []
+        self.next_id = 100
+
+    def add(self, domain, severity="suspend"):
+        self.next_id += 1
+        # Include the fields we don't import, as a real instance does
+        item = {
+            "id": str(self.next_id),
+            "domain": domain,
+            "digest": "0" * 64,
+            "created_at": "2024-11-01T00:00:00.000Z",
+            "severity": severity,
+            "reject_media": False,
+            "reject_reports": False,
+            "private_comment": "added by hand",
+            "public_comment": "",
+            "obfuscate": False,
+        }
+        self.blocks[item["id"]] = item
+        return item
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        params = params or {}
+        self.requests.append(params)
+        # Pages are always newest first
+        ids = sorted(self.blocks, key=int, reverse=True)
+        if "min_id" in params:
+            # The oldest blocks newer than min_id
+            newer = [id for id in ids if int(id) > int(params["min_id"])]
+            start = max(0, len(newer) - params["limit"])
+            ids = newer[start:]
+        elif "limit" in params:
+            ids = ids[: params["limit"]]
+        return FakeResponse([self.blocks[id] for id in ids])
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = FakeAdminAPI()
+    monkeypatch.setattr(fediblockhole.requests, "get", api.get)
+    monkeypatch.setattr(fediblockhole, "MIRROR_PAGE_LIMIT", 3)
+    return api
+
+
+def test_first_refresh_fetches_everything(api):
+    for i in range(5):
+        api.add(f"{i}.example")
+    mirror = InstanceMirror("fake.host")
+
+    refresh_mirror(mirror, "fake.host", "token")
+
+    assert len(mirror) == 5
+    assert api.requests == [{}]
+
+
+def test_refresh_when_up_to_date(api):
+    for i in range(5):
+        api.add(f"{i}.example")
+    mirror = InstanceMirror("fake.host")
+    mirror.replace(list(api.blocks.values()))
+
+    refresh_mirror(mirror, "fake.host", "token")
+
+    assert api.requests == [{"limit": 3}]
+
+
+def test_refresh_adds_new_blocks(api):
+    for i in range(5):
+        api.add(f"{i}.example")
+    mirror = InstanceMirror("fake.host")
+    mirror.replace(list(api.blocks.values()))
+    api.add("new.example")
+
+    refresh_mirror(mirror, "fake.host", "token")
+
+    assert api.requests == [{"limit": 3}]
+    assert mirror.blockdata(1)[0]["domain"] == "new.example"
+
+
+def test_refresh_with_newest_page(api):
+    for i in range(5):
+        api.add(f"{i}.example")
+    mirror = InstanceMirror("fake.host")
+    mirror.replace(list(api.blocks.values()))
+    api.add("new.example")
+    page = json.loads(api.get(None, params={"limit": 3}).content)
+    api.requests.clear()
+
+    refresh_mirror(mirror, "fake.host", "token", newest_page=page)
+
+    assert api.requests == []
+    assert mirror.blockdata(1)[0]["domain"] == "new.example"
+
+
+def test_refresh_pages_through_many_new_blocks(api):
+    api.add("old.example")
+    mirror = InstanceMirror("fake.host")
+    mirror.replace(list(api.blocks.values()))
+    for i in range(7):
+        api.add(f"{i}.example")
+
+    refresh_mirror(mirror, "fake.host", "token")
+
+    assert len(mirror) == 8
+    assert api.requests == [
+        {"limit": 3},
+        {"limit": 3, "min_id": 101},
+        {"limit": 3, "min_id": 104},
+        {"limit": 3, "min_id": 107},
+    ]
+
+
+def test_refresh_after_removal_fetches_everything(api):
+    for i in range(5):
+        api.add(f"{i}.example")
+    mirror = InstanceMirror("fake.host")
+    mirror.replace(list(api.blocks.values()))
+    del api.blocks["105"]
+
+    refresh_mirror(mirror, "fake.host", "token")
+
+    assert api.requests == [{"limit": 3}, {}]
+    assert len(mirror) == 4
+
+
+def test_mirror_save_and_load(tmp_path):
+    mirrorfile = str(tmp_path / "mirror.json")
+    mirror = InstanceMirror("fake.host")
+    mirror.update([{"id": "1", "domain": "bad.example"}])
+    mirror.save(mirrorfile)
+
+    assert InstanceMirror.load(mirrorfile, "fake.host").blocks == mirror.blocks
+    # A mirror of a different host isn't used
+    assert len(InstanceMirror.load(mirrorfile, "other.host")) == 0
+
+
+def test_push_writes_through_to_mirror(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(fediblockhole, "API_CALL_DELAY", 0)
+    monkeypatch.setattr(
+        fediblockhole,
+        "add_block",
+        lambda token, host, block, scheme: api.add(block.domain, str(block.severity)),
+    )
+    api.add("old.example")
+    mirrorfile = str(tmp_path / "mirror.json")
+    merged = Blocklist(
+        "merged",
+        {
+            "old.example": DomainBlock("old.example", "suspend"),
+            "new.example": DomainBlock("new.example", "silence"),
+        },
+    )
+
+    push_blocklist("token", "fake.host", merged, mirror_file=mirrorfile)
+    api.requests.clear()
+    stats = push_blocklist("token", "fake.host", merged, mirror_file=mirrorfile)
+
+    # The second push finds nothing to do, from a single request
+    assert stats["unchanged"] == 2
+    assert api.requests == [{"limit": 3}]
+
+
+def test_refresh_when_stale(api):
+    for i in range(5):
+        api.add(f"{i}.example")
+    mirror = InstanceMirror("fake.host", max_age=3600)
+    mirror.replace(list(api.blocks.values()))
+    # An old block was removed by someone else
+    del api.blocks["101"]
+    mirror.refreshed_at -= 3600
+
+    refresh_mirror(mirror, "fake.host", "token")
+
+    assert api.requests == [{}]
+    assert "101" not in mirror.blocks
+
+
+def test_parsing_keeps_mirror_intact(api, tmp_path):
+    api.add("0.example")
+    mirrorfile = str(tmp_path / "mirror.json")
+    mirror = InstanceMirror("fake.host")
+
+    fetch_mirrored_blocklist("fake.host", "token", mirror, ["domain", "severity"])
+    mirror.save(mirrorfile)
+    api.requests.clear()
+    mirror = InstanceMirror.load(mirrorfile, "fake.host")
+    fetch_mirrored_blocklist("fake.host", "token", mirror, ["domain", "severity"])
+
+    # Fields we didn't import are still in the mirror, so it still matches
+    assert mirror.blocks["101"]["private_comment"] == "added by hand"
+    assert api.requests == [{"limit": 3}]
@@ -0,0 +1,386 @@
+"""Test pushing blocklists to instances
+"""
+
+import json
+import logging
+import threading
+import time
+
+import pytest
+
+import fediblockhole
+from fediblockhole import execute_changeset, is_change_needed, plan_push, push_blocklist
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.changeset import BlockChange, Changeset
+from fediblockhole.const import BlockSeverity, DomainBlock
+
+
+@pytest.fixture
+def fake_instance(monkeypatch):
+    """Replace the instance API calls with a fake instance"""
+
+    class FakeInstance:
+        def __init__(self):
+            self.blocks = Blocklist("fake")
+            self.added = []
+            self.updated = []
+
+        def fetch_instance_blocklist(self, host, token, admin, import_fields, scheme):
+            return Blocklist("fake", {k: v.copy() for k, v in self.blocks.items()})
+
+        def add_block(self, token, host, block, scheme):
+            self.added.append(block.copy())
+
+        def update_known_block(self, token, host, block, scheme):
+            self.updated.append(block.copy())
+
+    instance = FakeInstance()
+    monkeypatch.setattr(fediblockhole, "API_CALL_DELAY", 0)
+    for name in ["fetch_instance_blocklist", "add_block", "update_known_block"]:
+        monkeypatch.setattr(fediblockhole, name, getattr(instance, name))
+    return instance
+
+
+def test_change_needed_ignores_unimported_fields():
+    """Fields we didn't import shouldn't trigger an update"""
+    old = DomainBlock("example.org", "suspend", "spam", "server comment", id=5)
+    new = DomainBlock("example.org", "suspend", "spam")
+
+    assert is_change_needed(old, new, ["domain", "severity", "id"]) == []
+    assert is_change_needed(old, new, ["domain", "severity", "private_comment"]) == [
+        "private_comment"
+    ]
+
+
+def test_change_needed_severity():
+    old = DomainBlock("example.org", "silence", id=5)
+    new = DomainBlock("example.org", "suspend")
+
+    assert is_change_needed(old, new, ["domain", "severity", "id"]) == ["severity"]
+
+
+def test_push_skips_unchanged(fake_instance):
+    fake_instance.blocks.blocks["example.org"] = DomainBlock(
+        "example.org", "silence", "spam", "server comment", id=1
+    )
+    merged = Blocklist(
+        "merged",
+        {
+            "example.org": DomainBlock("example.org", "silence", "spam"),
+            "new.example.org": DomainBlock("new.example.org", "silence"),
+        },
+    )
+
+    stats = push_blocklist(
+        "token", "fake.host", merged, import_fields=["domain", "severity"]
+    )
+
+    assert stats["unchanged"] == 1
+    assert stats["updated"] == 0
+    assert stats["added"] == 1
+    assert fake_instance.updated == []
+    assert [b.domain for b in fake_instance.added] == ["new.example.org"]
+
+
+def test_push_updates_changed(fake_instance):
+    fake_instance.blocks.blocks["example.org"] = DomainBlock(
+        "example.org", "silence", "spam", id=1
+    )
+    merged = Blocklist(
+        "merged",
+        {"example.org": DomainBlock("example.org", "silence", "spam, nazis")},
+    )
+
+    stats = push_blocklist(
+        "token",
+        "fake.host",
+        merged,
+        import_fields=["domain", "severity", "public_comment"],
+    )
+
+    assert stats["updated"] == 1
+    assert stats["unchanged"] == 0
+    assert fake_instance.updated[0].public_comment == "spam, nazis"
+    assert fake_instance.updated[0].id == 1
+
+
+def test_plan_push(fake_instance):
+    fake_instance.blocks.blocks["same.example.org"] = DomainBlock(
+        "same.example.org", "silence", id=1
+    )
+    fake_instance.blocks.blocks["changed.example.org"] = DomainBlock(
+        "changed.example.org", "silence", id=2
+    )
+    merged = Blocklist(
+        "merged",
+        {
+            "same.example.org": DomainBlock("same.example.org", "silence"),
+            "changed.example.org": DomainBlock("changed.example.org", "noop"),
+            "new.example.org": DomainBlock("new.example.org", "silence"),
+        },
+    )
+
+    changeset = plan_push("token", "fake.host", merged, ["domain", "severity"])
+
+    assert changeset.noops == ["same.example.org"]
+    assert [c.domain for c in changeset.updates] == ["changed.example.org"]
+    assert changeset.updates[0].diffs == ["severity"]
+    assert changeset.updates[0].block.id == 2
+    assert [c.domain for c in changeset.adds] == ["new.example.org"]
+    assert changeset.api_calls() == 2
+    # Planning doesn't change anything
+    assert fake_instance.added == []
+    assert fake_instance.updated == []
+
+
+def test_plan_doesnt_change_merged(fake_instance):
+    merged = Blocklist(
+        "merged", {"new.example.org": DomainBlock("new.example.org", "silence")}
+    )
+
+    changeset = plan_push(
+        "token",
+        "fake.host",
+        merged,
+        override_private_comment="added by fediblockhole",
+    )
+
+    assert changeset.adds[0].block.private_comment == "added by fediblockhole"
+    assert merged["new.example.org"].private_comment == ""
+
+
+def test_plan_skips_followed_severity(fake_instance, monkeypatch):
+    """Keeping a severity for followers skips the update entirely"""
+    monkeypatch.setattr(fediblockhole, "fetch_instance_follows", lambda *args: 3)
+    fake_instance.blocks.blocks["followed.example.org"] = DomainBlock(
+        "followed.example.org", "silence", id=1
+    )
+    merged = Blocklist(
+        "merged",
+        {"followed.example.org": DomainBlock("followed.example.org", "suspend")},
+    )
+
+    changeset = plan_push("token", "fake.host", merged, ["domain", "severity"])
+    stats = execute_changeset("token", "fake.host", changeset)
+
+    assert changeset.updates == []
+    assert changeset.skipped[0].reason == "severity limited by followers"
+    assert stats["skipped"] == 1
+    assert fake_instance.updated == []
+
+
+def test_push_logs_name_host(fake_instance, monkeypatch, caplog):
+    """Pushes to several instances run at once, so messages name the instance"""
+    monkeypatch.setattr(fediblockhole, "fetch_instance_follows", lambda *args: 3)
+    fake_instance.blocks.blocks["followed.example.org"] = DomainBlock(
+        "followed.example.org", "silence", id=1
+    )
+    merged = Blocklist(
+        "merged",
+        {"followed.example.org": DomainBlock("followed.example.org", "suspend")},
+    )
+
+    with caplog.at_level(logging.INFO):
+        push_blocklist("token", "fake.host", merged, dryrun=True)
+
+    assert (
+        "Keeping severity of block for followed.example.org at fake.host" in caplog.text
+    )
+    assert "Not applying changes to fake.host." in caplog.text
+
+
+def test_changeset_to_json(fake_instance):
+    fake_instance.blocks.blocks["changed.example.org"] = DomainBlock(
+        "changed.example.org", "silence", id=2
+    )
+    merged = Blocklist(
+        "merged",
+        {
+            "changed.example.org": DomainBlock("changed.example.org", "noop"),
+            "new.example.org": DomainBlock("new.example.org", "silence"),
+        },
+    )
+    changeset = plan_push("token", "fake.host", merged, ["domain", "severity"])
+
+    plan = json.loads(changeset.to_json(api_call_delay=1.5))
+
+    assert plan["host"] == "fake.host"
+    assert plan["estimate"] == {"api_calls": 2, "seconds": 3.0}
+    assert plan["updates"][0]["diffs"] == {"severity": ["silence", "noop"]}
+    assert plan["adds"][0]["block"]["domain"] == "new.example.org"
+
+
+def test_push_saves_plan(fake_instance, tmp_path):
+    planfile = tmp_path / "plan.json"
+    merged = Blocklist(
+        "merged", {"new.example.org": DomainBlock("new.example.org", "silence")}
+    )
+
+    push_blocklist("token", "fake.host", merged, dryrun=True, plan_file=str(planfile))
+
+    plan = json.loads(planfile.read_text())
+    assert [add["domain"] for add in plan["adds"]] == ["new.example.org"]
+    assert fake_instance.added == []
+
+
+def test_plan_prefetches_follows(fake_instance, monkeypatch):
+    """Follow counts are fetched concurrently, and only where needed"""
+    barrier = threading.Barrier(2, timeout=5)
+    fetched = []
+
+    def fake_follows(token, host, domain, scheme):
+        fetched.append(domain)
+        barrier.wait()
+        return 1 if domain == "followed.example.org" else 0
+
+    monkeypatch.setattr(fediblockhole, "fetch_instance_follows", fake_follows)
+    merged = Blocklist(
+        "merged",
+        {
+            "followed.example.org": DomainBlock("followed.example.org", "suspend"),
+            "quiet.example.org": DomainBlock("quiet.example.org", "suspend"),
+            "silenced.example.org": DomainBlock("silenced.example.org", "silence"),
+        },
+    )
+
+    changeset = plan_push("token", "fake.host", merged, max_in_flight=2)
+
+    assert sorted(fetched) == ["followed.example.org", "quiet.example.org"]
+    severities = {c.domain: str(c.block.severity) for c in changeset.adds}
+    assert severities == {
+        "followed.example.org": "silence",
+        "quiet.example.org": "suspend",
+        "silenced.example.org": "silence",
+    }
+
+
+def test_change_priority():
+    new_suspend = BlockChange(DomainBlock("a.example", "suspend"))
+    new_silence = BlockChange(DomainBlock("b.example", "silence"))
+    increase = BlockChange(
+        DomainBlock("c.example", "suspend", id=1),
+        DomainBlock("c.example", "silence", id=1),
+        ["severity"],
+    )
+    decrease = BlockChange(
+        DomainBlock("d.example", "noop", id=2),
+        DomainBlock("d.example", "silence", id=2),
+        ["severity"],
+    )
+    comment = BlockChange(
+        DomainBlock("e.example", "suspend", "spam", id=3),
+        DomainBlock("e.example", "suspend", id=3),
+        ["public_comment"],
+    )
+    changes = [comment, decrease, new_silence, increase, new_suspend]
+
+    changes.sort(key=BlockChange.priority)
+
+    assert [c.domain for c in changes] == [
+        "a.example",
+        "c.example",
+        "b.example",
+        "e.example",
+        "d.example",
+    ]
+
+
+def test_push_most_severe_first(fake_instance):
+    merged = Blocklist(
+        "merged",
+        {
+            "noop.example.org": DomainBlock("noop.example.org", "noop"),
+            "silence.example.org": DomainBlock("silence.example.org", "silence"),
+            "suspend.example.org": DomainBlock("suspend.example.org", "suspend"),
+        },
+    )
+
+    push_blocklist(
+        "token", "fake.host", merged, max_followed_severity=BlockSeverity("suspend")
+    )
+
+    assert [b.domain for b in fake_instance.added] == [
+        "suspend.example.org",
+        "silence.example.org",
+        "noop.example.org",
+    ]
+
+
+def test_changes_deferred_after_deadline(fake_instance):
+    changeset = Changeset("fake.host")
+    changeset.adds = [
+        BlockChange(DomainBlock("one.example.org", "suspend")),
+        BlockChange(DomainBlock("two.example.org", "suspend")),
+    ]
+
+    stats = execute_changeset(
+        "token", "fake.host", changeset, deadline=time.monotonic()
+    )
+
+    assert stats["added"] == 0
+    assert stats["deferred"] == 2
+    assert fake_instance.added == []
+
+
+def test_plan_skips_adds_instance_would_refuse(fake_instance):
+    fake_instance.blocks.blocks["bad.example.org"] = DomainBlock(
+        "bad.example.org", "suspend", id=1
+    )
+    merged = Blocklist(
+        "merged",
+        {
+            "a.bad.example.org": DomainBlock("a.bad.example.org", "silence"),
+            "b.bad.example.org": DomainBlock("b.bad.example.org", "suspend"),
+        },
+    )
+
+    stats = push_blocklist(
+        "token", "fake.host", merged, max_followed_severity=BlockSeverity("suspend")
+    )
+
+    assert stats["skipped"] == 1
+    assert stats["added"] == 1
+    assert [b.domain for b in fake_instance.added] == ["b.bad.example.org"]
+
+
+def test_update_keeps_unimported_fields(fake_instance):
+    fake_instance.blocks.blocks["example.org"] = DomainBlock(
+        "example.org", "silence", "spam", "server comment", reject_media=True, id=1
+    )
+    merged = Blocklist(
+        "merged", {"example.org": DomainBlock("example.org", "noop", "other")}
+    )
+
+    changeset = plan_push("token", "fake.host", merged, ["domain", "severity"])
+
+    block = changeset.updates[0].block
+    assert changeset.updates[0].diffs == ["severity"]
+    assert str(block.severity) == "noop"
+    assert block.public_comment == "spam"
+    assert block.private_comment == "server comment"
+    assert block.reject_media is True
+
+
+def test_push_shares_one_limiter(fake_instance, monkeypatch):
+    """Follow counts and writes to an instance are rate limited together"""
+    limiters = []
+
+    class CountingLimiter(fediblockhole.RateLimiter):
+        def __init__(self, delay):
+            super().__init__(delay)
+            self.calls = 0
+            limiters.append(self)
+
+        def acquire(self):
+            self.calls += 1
+            super().acquire()
+
+    monkeypatch.setattr(fediblockhole, "RateLimiter", CountingLimiter)
+    monkeypatch.setattr(fediblockhole, "fetch_instance_follows", lambda *args: 0)
+    merged = Blocklist("merged", {"example.org": DomainBlock("example.org", "suspend")})
+
+    push_blocklist("token", "fake.host", merged)
+
+    # One call for the follow count, and one to add the block
+    assert len(limiters) == 1
+    assert limiters[0].calls == 2
@@ -0,0 +1,85 @@
+"""Test pushing to several destination instances
+"""
+
+import threading
+from collections import Counter
+
+import pytest
+from util import shim_argparse
+
+import fediblockhole
+from fediblockhole import push_to_destinations
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.const import DomainBlock
+
+TOMLDATA = """
+push_concurrency = 3
+blocklist_instance_destinations = [
+  { domain = 'one.example', token = 'token1' },
+  { domain = 'two.example', token = 'token2' },
+  { domain = 'three.example', token = 'token3' },
+]
+"""
+
+
+@pytest.fixture
+def merged():
+    return Blocklist(
+        "merged", {"bad.example.org": DomainBlock("bad.example.org", "suspend")}
+    )
+
+
+def test_push_concurrency_config():
+    conf = shim_argparse([], TOMLDATA)
+
+    assert conf.push_concurrency == 3
+
+
+def test_push_concurrency_default():
+    conf = shim_argparse([], "\n")
+
+    assert conf.push_concurrency == 1
+
+
+def test_push_destinations_concurrently(monkeypatch, merged):
+    """All the destinations are pushed to at the same time"""
+    conf = shim_argparse([], TOMLDATA)
+    barrier = threading.Barrier(3, timeout=5)
+    pushed = []
+
+    def fake_push(token, host, blocklist, *args):
+        # Every push waits here until all three are running at once
+        barrier.wait()
+        pushed.append((host, token))
+        return Counter(added=1, updated=0, unchanged=2, skipped=0)
+
+    monkeypatch.setattr(fediblockhole, "push_blocklist", fake_push)
+
+    total = push_to_destinations(merged, conf, ["domain", "severity"])
+
+    assert sorted(pushed) == [
+        ("one.example", "token1"),
+        ("three.example", "token3"),
+        ("two.example", "token2"),
+    ]
+    assert total["added"] == 3
+    assert total["unchanged"] == 6
+
+
+def test_push_destination_failure(monkeypatch, merged):
+    """A failing destination doesn't stop the others"""
+    conf = shim_argparse(["--push-concurrency", "1"], TOMLDATA)
+    pushed = []
+
+    def fake_push(token, host, blocklist, *args):
+        if host == "two.example":
+            raise ValueError("Something went wrong")
+        pushed.append(host)
+        return Counter(added=1)
+
+    monkeypatch.setattr(fediblockhole, "push_blocklist", fake_push)
+
+    with pytest.raises(ValueError):
+        push_to_destinations(merged, conf, ["domain", "severity"])
+
+    assert sorted(pushed) == ["one.example", "three.example"]
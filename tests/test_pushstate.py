@@ -0,0 +1,133 @@
+"""Test skipping pushes to instances with nothing new to push
+"""
+
+from collections import Counter
+
+import pytest
+from util import shim_argparse
+
+import fediblockhole
+from fediblockhole import push_to_destinations
+from fediblockhole.blocklists import Blocklist
+from fediblockhole.const import DomainBlock
+from fediblockhole.pushstate import PushState
+
+TOMLDATA = """
+blocklist_instance_destinations = [
+  { domain = 'one.example', token = 'token1' },
+  { domain = 'two.example', token = 'token2' },
+]
+"""
+
+
+@pytest.fixture
+def merged():
+    return Blocklist(
+        "merged", {"bad.example.org": DomainBlock("bad.example.org", "suspend")}
+    )
+
+
+@pytest.fixture
+def instances(monkeypatch):
+    """Fake instances, whose newest blocks are given by `probes`"""
+
+    class FakeInstances:
+        def __init__(self):
+            self.probes = {"one.example": "a", "two.example": "b"}
+            self.pushed = []
+            self.pages = []
+            self.fetched = []
+            self.stats = Counter(added=1, deferred=0)
+
+        def push_blocklist(self, token, host, blocklist, *args):
+            self.pushed.append(host)
+            self.pages.append(args[-1])
+            return self.stats
+
+        def fetch_newest_blocks(self, host, token, scheme):
+            self.fetched.append(host)
+            return [{"id": "1", "domain": self.probes[host]}]
+
+    instances = FakeInstances()
+    for name in ["push_blocklist", "fetch_newest_blocks"]:
+        monkeypatch.setattr(fediblockhole, name, getattr(instances, name))
+    return instances
+
+
+def make_conf(tmp_path, *args):
+    return shim_argparse(
+        ["--push-state-file", str(tmp_path / "pushstate.json"), *args], TOMLDATA
+    )
+
+
+def test_push_state_config():
+    conf = shim_argparse(
+        [], 'push_state_file = "/tmp/pushstate.json"\npush_verify_interval = 3600\n'
+    )
+
+    assert conf.push_state_file == "/tmp/pushstate.json"
+    assert conf.push_verify_interval == 3600
+
+
+def test_skip_unchanged_destinations(tmp_path, instances, merged):
+    conf = make_conf(tmp_path)
+    push_to_destinations(merged, conf, ["domain", "severity"])
+    instances.pushed.clear()
+
+    push_to_destinations(merged, conf, ["domain", "severity"])
+    assert instances.pushed == []
+
+    # Someone changed the blocks on one of the instances
+    instances.probes["two.example"] = "c"
+    push_to_destinations(merged, conf, ["domain", "severity"])
+    assert instances.pushed == ["two.example"]
+
+
+def test_push_changed_blocklist(tmp_path, instances, merged):
+    conf = make_conf(tmp_path)
+    push_to_destinations(merged, conf, ["domain", "severity"])
+    instances.pushed.clear()
+
+    merged.blocks["bad.example.org"].severity = "silence"
+    push_to_destinations(merged, conf, ["domain", "severity"])
+
+    assert sorted(instances.pushed) == ["one.example", "two.example"]
+
+
+def test_push_deferred_changes_again(tmp_path, instances, merged):
+    conf = make_conf(tmp_path)
+    instances.stats = Counter(added=1, deferred=1)
+    push_to_destinations(merged, conf, ["domain", "severity"])
+    instances.pushed.clear()
+
+    push_to_destinations(merged, conf, ["domain", "severity"])
+
+    assert sorted(instances.pushed) == ["one.example", "two.example"]
+
+
+def test_verify_after_max_age(tmp_path):
+    filepath = str(tmp_path / "pushstate.json")
+    state = PushState(filepath, max_age=3600)
+    state.record("one.example", "digest", "probe")
+    state.save()
+
+    assert PushState.load(filepath, 3600).unchanged("one.example", "digest", "probe")
+    assert not PushState.load(filepath, 0).unchanged("one.example", "digest", "probe")
+
+
+def test_probe_only_with_saved_state(tmp_path, instances, merged):
+    conf = make_conf(tmp_path)
+    push_to_destinations(merged, conf, ["domain", "severity"])
+
+    # A full push is needed, so the instances are only probed after pushing
+    assert sorted(instances.fetched) == ["one.example", "two.example"]
+    assert instances.pages == [None, None]
+
+    instances.fetched.clear()
+    instances.probes["two.example"] = "c"
+    push_to_destinations(merged, conf, ["domain", "severity"])
+
+    # The probe of two.example, then the probe after pushing to it
+    assert sorted(instances.fetched) == ["one.example", "two.example", "two.example"]
+    # The probed page is passed on, so the mirror doesn't fetch it again
+    assert instances.pages[-1] == [{"id": "1", "domain": "c"}]
@@ -0,0 +1,95 @@
+"""Test rate limiting and concurrent writes to an instance
+"""
+
+import threading
+
+import pytest
+
+import fediblockhole
+from fediblockhole import apply_writes
+from fediblockhole.changeset import BlockChange
+from fediblockhole.const import DomainBlock
+from fediblockhole.ratelimit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fediblockhole.ratelimit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(fediblockhole.ratelimit.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_limiter_spaces_calls(clock):
+    limiter = RateLimiter(1.0)
+
+    limiter.acquire()
+    limiter.acquire()
+    clock.now += 0.25
+    limiter.acquire()
+
+    assert clock.sleeps == [1.0, 0.75]
+
+
+def test_limiter_doesnt_wait_after_slow_calls(clock):
+    limiter = RateLimiter(1.0)
+
+    limiter.acquire()
+    clock.now += 5
+    limiter.acquire()
+
+    assert clock.sleeps == []
+
+
+def make_writes(write, domains):
+    return [(write, BlockChange(DomainBlock(domain))) for domain in domains]
+
+
+def test_writes_in_flight(monkeypatch):
+    """Writes are made concurrently, in order for each domain"""
+    monkeypatch.setattr(fediblockhole, "API_CALL_DELAY", 0)
+    barrier = threading.Barrier(2, timeout=5)
+    lock = threading.Lock()
+    written = []
+
+    def write(token, host, block, scheme):
+        with lock:
+            written.append(block.domain)
+        if block.domain in ["a.example", "b.example"]:
+            barrier.wait()
+
+    # a.example and b.example land in different workers, and each waits for
+    # the other, so this only finishes if they're in flight at the same time
+    domains = ["a.example", "b.example", "a.example", "b.example"]
+    apply_writes("token", "fake.host", make_writes(write, domains), max_in_flight=2)
+
+    assert sorted(written) == sorted(domains)
+
+
+def test_writes_stop_on_failure(monkeypatch):
+    monkeypatch.setattr(fediblockhole, "API_CALL_DELAY", 0)
+    written = []
+
+    def write(token, host, block, scheme):
+        if block.domain == "bad.example":
+            raise ValueError("Something went wrong")
+        written.append(block.domain)
+
+    writes = make_writes(write, ["one.example", "bad.example", "two.example"])
+    with pytest.raises(ValueError):
+        apply_writes("token", "fake.host", writes)
+
+    assert written == ["one.example"]